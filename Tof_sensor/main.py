@@ -9,10 +9,18 @@ import matplotlib.animation as animation
 import struct
 import logging
 import pandas as pd
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # shared serial_common package
+from serial_common.protocol import frameParser, readChunk
+from serial_common.detection import zoneDetector
 
 logging.basicConfig(filename='value.log', level=logging.INFO)
 
 limit = 400  # set sensor max output
+zones = (50, 200, 400)  # Stop / Slow / Object detected / free distance borders
+hysteresis = 10         # distance margin needed to go back to a safer zone
 
 class serialPlot:
     def __init__(self, serialPort = 'COM5', serialBaud = 115200, plotLength = 100, dataNumBytes = 4):
@@ -21,6 +29,9 @@ class serialPlot:
         self.plotMaxLength = plotLength
         self.dataNumBytes = dataNumBytes
         self.rawData = bytearray(dataNumBytes)
+        self.parser = frameParser(dataNumBytes)     # one frame per sample
+        self.detector = zoneDetector(zones, hysteresis=hysteresis)    # runs in the reader thread
+        self.detector.subscribe(lambda event: print(event.label))     # print only when the zone changes
         self.data = collections.deque([0] * plotLength, maxlen=plotLength)
         self.isRun = True
         self.isReceiving = False
@@ -62,15 +73,6 @@ class serialPlot:
         # output_string = str(self.rawData, 'utf-8')
         # logging.info(value) # to log output values
 
-        if value >= 400:
-            print(0)
-        elif 200 < value < 400:
-            print("Object detected")
-        elif 50 < value < 200:
-            print("Slow")
-        elif value < 50:
-            print("Stop")
-
 
 
 
@@ -78,15 +80,22 @@ class serialPlot:
         time.sleep(1.0)  # give some buffer time for retrieving data
         self.serialConnection.reset_input_buffer()
         while (self.isRun):
-            self.serialConnection.readinto(self.rawData)
-            self.isReceiving = True
-            #print(self.rawData)
+            frames = self.parser.feed(readChunk(self.serialConnection))  # drain everything waiting in one read
+            if frames:
+                arrival = time.perf_counter_ns()
+                for seq, payload in frames:
+                    value, = struct.unpack('h', payload)
+                    self.detector.update(value, seq, arrival)  # zone events straight from the reader thread
+                seq, payload = frames[-1]   # newest complete frame
+                self.rawData[:] = payload
+                self.isReceiving = True
 
     def close(self):
         self.isRun = False
         self.thread.join()
         self.serialConnection.close()
         print('Disconnected...')
+        print('Detection latency: ' + str(self.detector.latencyStats()))
         # df = pd.DataFrame(self.csvData)
         # df.to_csv('/home/rikisenia/Desktop/data.csv')
 
@@ -1,32 +1,57 @@
 #!/usr/bin/env python
-import logging
 from threading import Thread
 import serial
 import time
-import collections
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-import struct
-import copy
-import pandas as pd
+import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # shared serial_common package
+from serial_common.protocol import frameParser, readChunk
+from serial_common.schema import frameSchema
+from serial_common.ring import sampleRing
+from serial_common.pipeline import tofPipeline
+from serial_common.filters import parseFilters
+from serial_common.detection import zoneDetector
+from serial_common.sessionlog import sessionLogger
+from serial_common.export import sessionExporter
+from serial_common.timing import sampleClock
+from serial_common.decimate import decimate, minMax
+from serial_common.history import tieredHistory
+from serial_common.pubsub import samplePublisher
+from serial_common.acquisition import acquisitionProcess
+from serial_common import metrics
 
 limit = 1000     # set sensor max output
 log = False     # enable log data
+log_interval = 0.5  # seconds between two writes of the session log
+export = None   # 'parquet' or 'arrow': the same records as the log, compressed columnar (query with serial_common.export)
 obj = True      # print object detection
 plt_min = False  # if true print the min value instead
-plt_err = True  # if true print the corrected error values instead
-array_dimension = 15    # create an array with old received values
+plt_err = True  # if true print the corrected (and filtered) values instead of the raw ones
+array_dimension = 15    # same value this many samples in a row means the sensor is stuck
+range_min = 0           # raw readings outside [range_min, range_max] mark the channel invalid
+range_max = 8191
+dropout_value = None    # value the sensor sends when it has no reading, None to disable
+max_variance = None     # rolling variance above this marks the channel as too noisy, None to disable
+zones = (50, 150, 300)  # Stop / Slow / Object detected / free distance borders
+hysteresis = 10         # distance margin needed to go back to a safer zone
+filters = None          # streaming filters before the detection, e.g. 'gate:150:5, median:5' or 'kalman:1:25'
 frequency = 50
-
-saved_data_1 = [0]*array_dimension
-saved_data_2 = [0]*array_dimension
-saved_data_3 = [0]*array_dimension
-
-if log:
-    logging.basicConfig(filename='value.log', level=logging.INFO, format='%(message)s')
-    name_array = str(['Sensor 1', 'Sensor 2', 'Sensor 3', 'Sensor 1 corrected', 'Sensor 2 corrected',
-                      'Sensor 3 corrected', 'Min. value original', 'Min value correct'])[1:-1]
-    logging.info(name_array)  # to log output values
+headless = False    # only acquisition, detection and logging, no plot window (same as --headless)
+ringLength = 65536   # samples kept for the consumers that fall behind
+publish_address = None  # ('127.0.0.1', 5600) or '/tmp/serialplot.sock': raw and corrected samples for other processes
+metrics_port = None     # e.g. 9100: Prometheus text metrics on http://127.0.0.1:metrics_port/metrics, None to disable
+time_axis = True    # x axis in seconds before the newest sample instead of the sample index
+plot_window = 10.0  # seconds shown (samples if not time_axis), + and - on the plot double / halve it, space freezes it for zoom and pan
+plot_points = 1000  # points drawn per line whatever the window length
+decimation = 'minmax'   # 'minmax' envelope per pixel column or 'lttb'
+oversampling = 10   # raw samples up to this many times plot_points are read, then decimated to plot_points (raw tier only)
+historyLength = 1 << 18     # raw plotted samples kept
+history_tiers = (10, 100, 1000)     # then min / max / mean rows over this many samples, 1 << 16 rows each
+acquisition_process = False     # read, decode and detect in a separate process writing a shared memory ring
 
 class serialPlot:
     def __init__(self, serialPort='/dev/ttyUSB0', serialBaud=38400, plotLength=100, dataNumBytes=2, numPlots=1):
@@ -35,22 +60,83 @@ class serialPlot:
         self.plotMaxLength = plotLength
         self.dataNumBytes = dataNumBytes
         self.numPlots = numPlots
-        self.rawData = bytearray(numPlots * dataNumBytes)
         self.dataType = None
         if dataNumBytes == 2:
             self.dataType = 'h'     # 2 byte integer
         elif dataNumBytes == 4:
             self.dataType = 'f'     # 4 byte float
-        self.data = []
-        for i in range(numPlots):   # give an array for each type of data and store them in a list
-            self.data.append(collections.deque([0] * plotLength, maxlen=plotLength))
+        self.schema = frameSchema.uniform(numPlots, self.dataType)     # a whole read is decoded at once
+        self.parser = frameParser(self.schema.size)     # every frame carries one sample of all the channels
+        self.samples = sampleRing(2 * numPlots, ringLength, np.dtype(self.dataType))   # raw and corrected values of every sample, with its arrival time
+        self.clock = sampleClock()     # arrival time and device counter of every frame, rate and jitter
+        self.detector = zoneDetector(zones, hysteresis=hysteresis)    # runs in the reader thread
+        if obj:
+            self.detector.subscribe(lambda event: print(event.label))     # print only when the zone changes
+        self.pipeline = tofPipeline(numPlots, limit, array_dimension, range_min, range_max, dropout_value, max_variance,
+                                    self.detector, parseFilters(filters, numPlots) if filters else None)
+        self.acquisition = None
+        if acquisition_process:     # same pipeline in its own process, its zone events replayed on self.detector
+            self.acquisition = acquisitionProcess(serialPort, serialBaud, numPlots, self.dataType, ringLength,
+                                                  {'limit': limit, 'window': array_dimension, 'low': range_min,
+                                                   'high': range_max, 'dropoutValue': dropout_value,
+                                                   'maxVariance': max_variance, 'zones': zones, 'hysteresis': hysteresis,
+                                                   'filters': filters})
+            self.samples = self.acquisition.ring
+            self.parser = self.acquisition.parser   # counters and clock statistics from the ring header
+            self.clock = self.acquisition.clock
+        self.reader = self.samples.reader()
+        self.history = tieredHistory(numPlots, historyLength, history_tiers, 1 << 16)    # plotted values, written by the processing thread
+        self.plotWindow = plot_window if time_axis else plotLength
+        self.follow = True      # the plot window ends at the newest sample
+        self.reference = None   # newest sample when the plot was frozen, ns
+        self.latest = [0] * numPlots
+        self.logger = None
+        self.exporter = None
+        columns = [('timestamp', np.int64), ('seq', np.int32)]
+        columns += [('Sensor ' + str(i + 1), self.dataType) for i in range(numPlots)]
+        columns += [('Sensor ' + str(i + 1) + ' corrected', self.dataType) for i in range(numPlots)]
+        columns += [('Min. value original', self.dataType), ('Min value correct', self.dataType)]
+        meta = {'port': serialPort, 'limit': limit, 'array_dimension': array_dimension, 'range': [range_min, range_max],
+                'dropout_value': dropout_value, 'max_variance': max_variance, 'zones': list(zones),
+                'hysteresis': hysteresis, 'filters': filters}
+        name = time.strftime('session_%Y%m%d_%H%M%S')
+        if log:     # binary session log, written by a background thread
+            self.logger = sessionLogger(name + '.bin', columns, log_interval, meta)
+        if export is not None:  # row groups of 65536 samples with min / max statistics, written by a background thread
+            self.exporter = sessionExporter(name + '.' + export, columns, meta=meta)
+        self.records = self.logger or self.exporter     # record layout, None when nothing is written
+        self.publisher = None
+        if publish_address is not None:    # subscribe with serial_common.pubsub.sampleSubscriber
+            self.publisher = samplePublisher(publish_address)
         self.isRun = True
         self.isReceiving = False
         self.thread = None
+        self.processThread = None
         self.plotTimer = 0
         self.previousTimer = 0
-        # self.csvData = []
+        self.readerLoops = 0
+        self.renderTime = 0.0   # seconds from the start of the last getSerialData to the end of its draw
+        self.frameStart = None
+        self.metrics = metrics.metricsRegistry()
+        metrics.watchParser(self.metrics, self.parser)
+        metrics.watchRing(self.metrics, self.samples, [self.reader])
+        metrics.watchDetector(self.metrics, self.detector)
+        metrics.watchClock(self.metrics, self.clock)
+        if self.logger is not None:
+            metrics.watchLogger(self.metrics, self.logger)
+        self.metrics.gauge('reader_loops_per_second', 'Iterations of the reader loop per second',
+                           metrics.rateMeter(lambda: self.acquisition.readerLoops() if self.acquisition else self.readerLoops))
+        self.metrics.gauge('render_seconds', 'Time of the last plot frame, update and draw', lambda: self.renderTime)
+        if metrics_port is not None:
+            try:
+                print('Metrics on http://%s:%d/metrics' % self.metrics.serve(metrics_port))
+            except OSError as error:
+                print('No metrics endpoint: ' + str(error))
 
+        self.serialConnection = None
+        if self.acquisition is not None:
+            print('Acquisition process reads ' + str(serialPort) + ' at ' + str(serialBaud) + ' BAUD.')
+            return
         print('Trying to connect to: ' + str(serialPort) + ' at ' + str(serialBaud) + ' BAUD.')
         try:
             self.serialConnection = serial.Serial(serialPort, serialBaud, timeout=4)
@@ -60,8 +146,14 @@ class serialPlot:
 
     def readSerialStart(self):
         if self.thread == None:
-            self.thread = Thread(target=self.backgroundThread)
-            self.thread.start()
+            if self.acquisition is not None:
+                self.acquisition.start()
+                self.thread = self.acquisition.process
+            else:
+                self.thread = Thread(target=self.backgroundThread)
+                self.thread.start()
+            self.processThread = Thread(target=self.processingThread)
+            self.processThread.start()
             # Block till we start receiving values
             while self.isReceiving != True:
                 time.sleep(0.1)
@@ -70,100 +162,155 @@ class serialPlot:
         currentTimer = time.perf_counter()
         self.plotTimer = int((currentTimer - self.previousTimer) * 1000)     # the first reading will be erroneous
         self.previousTimer = currentTimer
-        timeText.set_text('Plot Interval = ' + str(self.plotTimer) + 'ms')
-        privateData = copy.deepcopy(self.rawData[:])    # so that the 3 values in our plots will be synchronized to the same sample time
-        value_array = []
+        timeText.set_text('Plot Interval = ' + str(self.plotTimer) + 'ms, ' + '%.1f' % self.clock.rate() + ' Hz, jitter ' +
+                          '%.2f' % (self.clock.jitter() / 1e6) + 'ms')
+        ax = lines[0].axes
+        if self.follow:
+            ax.set_xlim(-self.plotWindow, 0)
+        times, low, high, mean, tier = self.window(*ax.get_xlim())
+        if time_axis:
+            x = (times - (self.reference or 0)) / 1e9
+        else:
+            x = np.arange(1 - len(times), 1)
         for i in range(self.numPlots):
-            data = privateData[(i*self.dataNumBytes):(self.dataNumBytes + i*self.dataNumBytes)]
-            value,  = struct.unpack('h', data)  # self.dataType
-
-            if value > limit:
-                value = limit
-            value_array.append(value)
-
-            if (not plt_min) and (not plt_err):
-                self.data[i].append(value)  # we get the latest data point and append it to our array
-                lines[i].set_data(range(self.plotMaxLength), self.data[i])
-                lineValueText[i].set_text('[' + lineLabel[i] + '] = ' + str(value))
-
-        min_value_original = min(value_array)
-        saved_data_1.append(value_array[0])       # add last value to array
-        saved_data_1.pop(0)                  # remove first value of array
-        saved_data_2.append(value_array[1])  # add last value to array
-        saved_data_2.pop(0)  # remove first value of array
-        saved_data_3.append(value_array[2])  # add last value to array
-        saved_data_3.pop(0)  # remove first value of array
-        log_array = []
-
-        for x in range(3):
-            log_array.append(value_array[x])
-
-        saved_value_1 = 0
-        for x in range(array_dimension):
-            saved_value_1 = saved_value_1 + saved_data_1[x]
-        if saved_data_1[0]*array_dimension-saved_value_1 == 0:      # if we measure the same values the sensor is stuck
-            value_array[0] = limit
-        saved_value_2 = 0
-        for x in range(array_dimension):
-            saved_value_2 = saved_value_2 + saved_data_2[x]
-        if saved_data_2[0] * array_dimension - saved_value_2 == 0:  # if we measure the same values the sensor is stuck
-            value_array[1] = limit
-        saved_value_3 = 0
-        for x in range(array_dimension):
-            saved_value_3 = saved_value_3 + saved_data_3[x]
-        if saved_data_3[0] * array_dimension - saved_value_3 == 0:  # if we measure the same values the sensor is stuck
-            value_array[2] = limit
-        min_value = min(value_array)
+            if tier == 0:
+                lines[i].set_data(*decimate(x, mean[:, i], plot_points, decimation))  # bounded cost for any window
+            else:   # aggregated history: envelope of the min and max of every row, at most plot_points too
+                lines[i].set_data(*minMax(np.repeat(x, 2), np.stack((low[:, i], high[:, i]), axis=1).ravel(), plot_points))
+            lineValueText[i].set_text('[' + lineLabel[i] + '] = ' + str(self.latest[i]))
+        self.frameStart = currentTimer    # renderTime is taken once the figure is drawn, in onDraw
 
-        if plt_err:
-            for i in range(self.numPlots):
-                self.data[i].append(value_array[i])  # we get the latest data point and append it to our array
-                lines[i].set_data(range(self.plotMaxLength), self.data[i])
-                lineValueText[i].set_text('[' + lineLabel[i] + '] = ' + str(value_array[i]))
+    def onDraw(self, event):
+        if self.frameStart is not None:
+            self.renderTime = time.perf_counter() - self.frameStart
+            self.frameStart = None
 
-        if obj:
-            if min_value >= 300:
-                print(0)
-            elif 150 < min_value < 300:
-                print("Object detected")
-            elif 50 < min_value < 150:
-                print("Slow")
-            elif min_value < 50:
-                print("Stop")
-
-        if log:
-            for x in range(3):
-                log_array.append(value_array[x])
-            log_array.append(min_value_original)
-            log_array.append(min_value)
-            new_value_array = str(log_array)[1:-1]  # crate array without bracket
-            logging.info(new_value_array)  # to log output values
+    def processingThread(self):    # logging and plot data of every sample, driven by data arrival
+        while (self.isRun):
+            if self.acquisition is not None:
+                self.acquisition.dispatch(self.detector)
+            if not self.reader.wait(0.5):
+                continue
+            views = self.reader.view()     # samples received since the last read, in place in the ring
+            if views is None:   # far behind: copies, the writer may lap the rows while they are used
+                seqs, timestamps, block = self.reader.drain()
+            else:   # the consumers copy what they keep, only the small columns are copied here
+                seqs, timestamps, block = views[0].copy(), views[1].copy(), views[2]
+            if len(block) == 0:
+                continue
+            if self.acquisition is not None:
+                if self.publisher is not None:
+                    self.publisher.publish(timestamps, seqs, np.array(block))    # queued until the batch is full
+                self.isReceiving = True
+            plot_block = self.processBlock(block)
+            if self.records is not None:
+                self.logSamples(seqs, timestamps, block)
+            self.history.append(timestamps, plot_block)
+            self.latest = plot_block[-1].tolist()
+            if views is not None and not self.reader.release(len(block)):
+                print('Plot data fell behind: samples overwritten while in use')
+
+    def processBlock(self, block):
+        # values to plot for the samples corrected by the reader thread, one row per sample
+        value_array = np.minimum(block[:, :self.numPlots], limit)
+        corrected = block[:, self.numPlots:]
+        plot_array = value_array
+
+        if plt_err:
+            plot_array = corrected
 
         if plt_min:
-            plt_min_array = []
-            plt_min_array.append(min_value_original)
-            plt_min_array.append(min_value)
-            plt_min_array.append(-1)
-            for i in range(self.numPlots):
-                self.data[i].append(plt_min_array[i])  # we get the latest data point and append it to our array
-                lines[i].set_data(range(self.plotMaxLength), self.data[i])
-                lineValueText[i].set_text('[' + lineLabel[i] + '] = ' + str(plt_min_array[i]))
+            plot_array = np.zeros((len(block), self.numPlots)) - 1
+            plot_array[:, 0] = value_array.min(axis=1)
+            plot_array[:, 1] = corrected.min(axis=1)
+        return plot_array
+
+    def window(self, left, right):
+        # (times, min, max, mean, tier) of the history between the x limits, newest last
+        if self.follow:
+            self.reference = self.history.newest()
+        if not time_axis or self.reference is None:     # raw samples by count
+            raw = self.history.tiers[0]
+            return raw.read(max(raw.oldest(), raw.head - int(self.plotWindow)), raw.head) + (0,)
+        start, stop = self.reference + int(left * 1e9), self.reference + int(right * 1e9)
+        result = self.history.query(start, stop, plot_points * oversampling)    # decimate reduces the raw tier to plot_points
+        if result[4] != 0:  # aggregated rows: two points each (min and max), minMax then halves them to plot_points
+            result = self.history.query(start, stop, plot_points)
+        return result
+
+    def onKey(self, event):
+        # + / - double / halve the plot window, space freezes it (then zoom and pan with the toolbar) or follows again
+        if event.key in ('+', '='):
+            self.plotWindow *= 2
+        elif event.key == '-':
+            self.plotWindow /= 2
+        elif event.key == ' ' and time_axis:
+            self.follow = not self.follow
+            print('Plot ' + ('follows the newest sample' if self.follow else 'frozen, zoom and pan to browse the history'))
+            return
+        else:
+            return
+        self.plotWindow = max(self.plotWindow, 0.1 if time_axis else 10)
+        print('Plot window: ' + str(self.plotWindow) + (' s' if time_axis else ' samples'))
+
+    def logSamples(self, seqs, timestamps, block):
+        # one log record per sample, filled column by column for the whole block
+        records = np.empty(len(block), self.records.dtype)
+        records['timestamp'] = timestamps
+        records['seq'] = seqs
+        raw = block[:, :self.numPlots]     # unclamped, so a replay can use another limit
+        corrected = block[:, self.numPlots:]
+        for i in range(self.numPlots):
+            records['Sensor ' + str(i + 1)] = raw[:, i]
+            records['Sensor ' + str(i + 1) + ' corrected'] = corrected[:, i]
+        records['Min. value original'] = np.minimum(raw, limit).min(axis=1)
+        records['Min value correct'] = corrected.min(axis=1)
+        if self.logger is not None:
+            self.logger.appendBlock(records)
+        if self.exporter is not None:
+            self.exporter.appendBlock(records)
 
     def backgroundThread(self):    # retrieve data
         time.sleep(1.0)  # give some buffer time for retrieving data
         self.serialConnection.reset_input_buffer()
         while (self.isRun):
-            self.serialConnection.readinto(self.rawData)
-            self.isReceiving = True
-            #print(self.rawData)
+            self.readerLoops += 1
+            frames = self.parser.feed(readChunk(self.serialConnection))  # drain everything waiting in one read
+            if frames:
+                arrival = time.perf_counter_ns()
+                times, counters = self.clock.update(arrival, [seq for seq, payload in frames])     # per frame time and device counter
+                block = self.schema.array([payload for seq, payload in frames], self.samples.values.dtype)
+                clamped, corrected, min_original, min_values = self.pipeline.processBlock(block, counters, times)  # zone events straight from the reader thread
+                combined = np.hstack((block, corrected)).astype(block.dtype)
+                self.samples.write(counters, combined, times)
+                if self.publisher is not None:
+                    self.publisher.publish(times, counters, combined)
+                self.isReceiving = True
 
     def close(self):
         self.isRun = False
-        self.thread.join()
-        self.serialConnection.close()
+        if self.acquisition is not None:
+            self.acquisition.stop()
+        else:
+            self.thread.join()
+        self.processThread.join()
+        if self.acquisition is not None:
+            self.acquisition.dispatch(self.detector)    # the last events of the acquisition process
+        if self.logger is not None:
+            self.logger.close()
+        if self.exporter is not None:
+            self.exporter.close()
+            print('Exported ' + str(self.exporter.written) + ' samples to ' + self.exporter.path)
+        if self.acquisition is None:
+            self.serialConnection.close()
+        self.metrics.close()
+        if self.publisher is not None:
+            self.publisher.close()
         print('Disconnected...')
-        # df = pd.DataFrame(self.csvData)
-        # df.to_csv('/home/rikisenia/Desktop/data.csv')
+        print('Detection latency: ' + str(self.detector.latencyStats()))
+        print('Sample timing: ' + str(self.clock.stats()))
+        if self.acquisition is not None:
+            self.acquisition.close()    # after the last read of its statistics
 
 
 def main():
@@ -175,6 +322,16 @@ def main():
     s = serialPlot(portName, baudRate, maxPlotLength, dataNumBytes, numPlots)   # initializes all required variables
     s.readSerialStart()                                               # starts background thread
 
+    if headless or '--headless' in sys.argv[1:]:
+        print('Running without plot, press Ctrl+C to stop.')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        s.close()
+        return
+
     # plotting starts below
     pltInterval = frequency    # Period at which the plot animation updates [ms]
     xmin = 0
@@ -184,7 +341,7 @@ def main():
     fig = plt.figure(figsize=(10, 8))
     ax = plt.axes(xlim=(xmin, xmax), ylim=(float(ymin - (ymax - ymin) / 10), float(ymax + (ymax - ymin) / 10)))
     ax.set_title('Tof Sensors')
-    ax.set_xlabel("Time")
+    ax.set_xlabel("Time [s]" if time_axis else "Time")
     ax.set_ylabel("Distance")
 
     if plt_min:
@@ -203,6 +360,8 @@ def main():
     for i in range(numPlots):
         lines.append(ax.plot([], [], style[i], label=lineLabel[i])[0])
         lineValueText.append(ax.text(0.70, 0.90-i*0.05, '', transform=ax.transAxes))
+    fig.canvas.mpl_connect('key_press_event', s.onKey)
+    fig.canvas.mpl_connect('draw_event', s.onDraw)
     anim = animation.FuncAnimation(fig, s.getSerialData, fargs=(lines, lineValueText, lineLabel, timeText), interval=pltInterval)    # fargs has to be a tuple
 
     plt.legend(loc="upper left")
@@ -6,14 +6,19 @@ import time
 import collections
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-import struct
-import copy
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # shared serial_common package
+from serial_common.protocol import frameParser, readChunk
+from serial_common.schema import frameSchema
+from serial_common.snapshot import frameBuffer
+from serial_common.health import healthMonitor
 
 limit = 1000    # set sensor max output
 log = False     # enable log data
 obj = False     # print object detection
-array_dimension = 15
-saved_data = [0]*array_dimension  # create an array with old received values
+array_dimension = 15    # same value this many frames in a row means the sensor is stuck
 
 class serialPlot:
     def __init__(self, serialPort='/dev/ttyUSB0', serialBaud=38400, plotLength=100, dataNumBytes=2, numPlots=1):
@@ -22,14 +27,17 @@ class serialPlot:
         self.plotMaxLength = plotLength
         self.dataNumBytes = dataNumBytes
         self.numPlots = numPlots
-        self.rawData = bytearray(numPlots * dataNumBytes)
+        self.parser = frameParser(numPlots * dataNumBytes)     # every frame carries one sample of all the channels
         self.dataType = None
         if dataNumBytes == 2:
             self.dataType = 'h'     # 2 byte integer
         elif dataNumBytes == 4:
             self.dataType = 'f'     # 4 byte float
+        self.frames = frameBuffer(numPlots * dataNumBytes, self.dataType)   # latest frame, shared by all the plots
+        self.schema = frameSchema.uniform(numPlots, self.dataType)
+        self.health = healthMonitor(numPlots, array_dimension)    # per channel stuck detection, on every frame
+        self.valid = [True] * numPlots     # of the newest frame, set by the reader thread
         self.data = []
-        self.privateData = None     # for storing a copy of the data so all plots are synchronized
         for i in range(numPlots):   # give an array for each type of data and store them in a list
             self.data.append(collections.deque([0] * plotLength, maxlen=plotLength))
         self.isRun = True
@@ -58,10 +66,9 @@ class serialPlot:
             currentTimer = time.perf_counter()
             self.plotTimer = int((currentTimer - self.previousTimer) * 1000)     # the first reading will be erroneous
             self.previousTimer = currentTimer
-        self.privateData = copy.deepcopy(self.rawData)    # so that the 3 values in our plots will be synchronized to the same sample time
         timeText.set_text('Plot Interval = ' + str(self.plotTimer) + 'ms')
-        data = self.privateData[(pltNumber*self.dataNumBytes):(self.dataNumBytes + pltNumber*self.dataNumBytes)]
-        value,  = struct.unpack(self.dataType, data)
+        number, values = self.frames.read()    # decoded once per frame, so all the plots show the same sample
+        value = values[pltNumber]
         value_array = []
         if value > limit:
             value = limit
@@ -72,12 +79,7 @@ class serialPlot:
         lineValueText.set_text('[' + lineLabel + '] = ' + str(value))
 
         min_value = min(value_array)
-        saved_data.append(min_value)  # add last value to array
-        saved_data.pop(0)  # remove first value of array
-        saved_value = 0
-        for x in range(array_dimension):
-            saved_value = saved_value + saved_data[x]
-        if saved_data[0] * array_dimension - saved_value == 0:  # if we measure the same values the sensor is stuck
+        if not self.valid[pltNumber]:  # the sensor is stuck
             min_value = limit
 
         if obj:
@@ -94,8 +96,13 @@ class serialPlot:
         time.sleep(1.0)  # give some buffer time for retrieving data
         self.serialConnection.reset_input_buffer()
         while (self.isRun):
-            self.serialConnection.readinto(self.rawData)
-            self.isReceiving = True
+            frames = self.parser.feed(readChunk(self.serialConnection))  # drain everything waiting in one read
+            if frames:
+                # health of every frame, not only of the ones the plot shows
+                self.valid = self.health.updateBlock(self.schema.array([payload for seq, payload in frames]))[-1]
+                seq, payload = frames[-1]   # newest complete frame
+                self.frames.publish(payload)
+                self.isReceiving = True
 
     def close(self):
         self.isRun = False
@@ -5,16 +5,21 @@ import serial
 import time
 import collections
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import struct
-import copy
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # shared serial_common package
+from serial_common.protocol import frameParser, readChunk
+from serial_common.schema import frameSchema
+from serial_common.snapshot import frameBuffer
+from serial_common.health import healthMonitor
+from serial_common.render import blitAnimation
 
 limit = 400    # set sensor max output
 log = False     # enable log data
 obj = False     # print object detection
-plt_err = False  # if true print the corrected error values instead !!!not working!!!
-array_dimension = 15
-saved_data = [0]*array_dimension  # create an array with old received values
+plt_err = False  # if true print the corrected error values instead
+array_dimension = 15    # same value this many frames in a row means the sensor is stuck
 
 class serialPlot:
     def __init__(self, serialPort='/dev/ttyUSB0', serialBaud=38400, plotLength=100, dataNumBytes=2, numPlots=1):
@@ -23,14 +28,17 @@ class serialPlot:
         self.plotMaxLength = plotLength
         self.dataNumBytes = dataNumBytes
         self.numPlots = numPlots
-        self.rawData = bytearray(numPlots * dataNumBytes)
+        self.parser = frameParser(numPlots * dataNumBytes)     # every frame carries one sample of all the channels
         self.dataType = None
         if dataNumBytes == 2:
             self.dataType = 'h'     # 2 byte integer
         elif dataNumBytes == 4:
             self.dataType = 'f'     # 4 byte float
+        self.frames = frameBuffer(numPlots * dataNumBytes, self.dataType)   # latest frame, shared by all the plots
+        self.schema = frameSchema.uniform(numPlots, self.dataType)
+        self.health = healthMonitor(numPlots, array_dimension)    # per channel stuck detection, on every frame
+        self.valid = [True] * numPlots     # of the newest frame, set by the reader thread
         self.data = []
-        self.privateData = None     # for storing a copy of the data so all plots are synchronized
         for i in range(numPlots):   # give an array for each type of data and store them in a list
             self.data.append(collections.deque([0] * plotLength, maxlen=plotLength))
         self.isRun = True
@@ -54,48 +62,46 @@ class serialPlot:
             while self.isReceiving != True:
                 time.sleep(0.1)
 
-    def getSerialData(self, frame, lines, lineLabel, pltNumber):
-        if pltNumber == 0:  # in order to make all the clocks show the same reading
-            currentTimer = time.perf_counter()
-            self.plotTimer = int((currentTimer - self.previousTimer) * 1000)     # the first reading will be erroneous
-            self.previousTimer = currentTimer
-        self.privateData = copy.deepcopy(self.rawData)    # so that the 3 values in our plots will be synchronized to the same sample time
-        data = self.privateData[(pltNumber*self.dataNumBytes):(self.dataNumBytes + pltNumber*self.dataNumBytes)]
-        value,  = struct.unpack(self.dataType, data)
-        value_array = []
-        if value > limit:
-            value = limit
-        value_array.append(value)
-
-        min_value = min(value_array)
-        if plt_err:
-            saved_data.append(min_value)  # add last value to array
-            saved_data.pop(0)  # remove first value of array
-            saved_value = 0
-            for x in range(array_dimension):
-                saved_value = saved_value + saved_data[x]
-            if saved_data[0] * array_dimension - saved_value == 0:  # if we measure the same values the sensor is stuck
+    def getSerialData(self, lines):
+        # one call per animation frame updates all the plots
+        currentTimer = time.perf_counter()
+        self.plotTimer = int((currentTimer - self.previousTimer) * 1000)     # the first reading will be erroneous
+        self.previousTimer = currentTimer
+        number, values = self.frames.read()    # decoded once per frame, so all the plots show the same sample
+        for pltNumber in range(self.numPlots):
+            value = values[pltNumber]
+            if value > limit:
+                value = limit
+
+            min_value = value
+            if plt_err and not self.valid[pltNumber]:  # the sensor is stuck
                 min_value = limit
 
-        self.data[pltNumber].append(value)    # we get the latest data point and append it to our array
-        lines.set_data(range(self.plotMaxLength), self.data[pltNumber])
+            self.data[pltNumber].append(min_value)    # we get the latest data point (corrected if plt_err) and append it to our array
+            lines[pltNumber].set_data(range(self.plotMaxLength), self.data[pltNumber])
 
-        if obj:
-            if min_value >= 300:
-                print(0)
-            elif 150 < min_value < 300:
-                print("Object detected")
-            elif 50 < min_value < 150:
-                print("Slow")
-            elif min_value < 50:
-                print("Stop")
+            if obj:
+                if min_value >= 300:
+                    print(0)
+                elif 150 < min_value < 300:
+                    print("Object detected")
+                elif 50 < min_value < 150:
+                    print("Slow")
+                elif min_value < 50:
+                    print("Stop")
+        return lines
 
     def backgroundThread(self):    # retrieve data
         time.sleep(1.0)  # give some buffer time for retrieving data
         self.serialConnection.reset_input_buffer()
         while (self.isRun):
-            self.serialConnection.readinto(self.rawData)
-            self.isReceiving = True
+            frames = self.parser.feed(readChunk(self.serialConnection))  # drain everything waiting in one read
+            if frames:
+                # health of every frame, not only of the ones the plot shows
+                self.valid = self.health.updateBlock(self.schema.array([payload for seq, payload in frames]))[-1]
+                seq, payload = frames[-1]   # newest complete frame
+                self.frames.publish(payload)
+                self.isReceiving = True
 
     def close(self):
         self.isRun = False
@@ -128,7 +134,6 @@ def main():
     pltInterval = 50    # Period at which the plot animation updates [ms]
     lineLabelText = ['Sensor 1', 'Sensor 2', 'Sensor 3']
     style = ['r-', 'g-', 'b-']    # linestyles for the different plots
-    anim = []
     fig, ax = plt.subplots(3)
     fig.set_figheight(8)
     fig.set_figwidth(10)
@@ -137,12 +142,14 @@ def main():
     ax[1].set_ylabel("Distance")
     ax[2].set_ylabel("Distance")
 
+    lines = []
     for i in range(numPlots):
         ax[i].set_xlim([0, maxPlotLength])
         ax[i].set_ylim([-1, limit + 200])
         ax[i].set_title(lineLabelText[i])
-        lines = ax[i].plot([], [], style[i])[0]
-        anim.append(animation.FuncAnimation(fig, s.getSerialData, fargs=(lines,  lineLabelText[i], i), interval=pltInterval))  # fargs has to be a tuple
+        lines.append(ax[i].plot([], [], style[i])[0])
+    statsText = fig.text(0.01, 0.01, '')    # measured frame rate and render cost
+    anim = blitAnimation(fig, lambda: s.getSerialData(lines), lines, pltInterval, statsText)   # one blitted animation for all the subplots
     plt.show()
 
     s.close()
@@ -5,23 +5,32 @@ import serial
 import time
 import collections
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import struct
-import copy
-import logging
+import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # shared serial_common package
+from serial_common.protocol import frameParser, readChunk
+from serial_common.ring import sampleRing
+from serial_common.schema import frameSchema
+from serial_common.snapshot import frameBuffer
+from serial_common.health import healthMonitor
+from serial_common.render import blitAnimation
+from serial_common.heatmap import gridPosition, gridShape, taxelHeatmap, waterfall
+from serial_common.sessionlog import sessionLogger
+from serial_common import metrics
 
 limit = 1000    # set sensor max output
 log = False     # enable log data
+log_interval = 0.5  # seconds between two writes of the session log
 obj = False     # print object detection
-plt_err = False  # if true print the corrected error values instead !!!not working!!!
-array_dimension = 6
-saved_data = [0]*array_dimension  # create an array with old received values
-
-if log:
-    logging.basicConfig(filename='value.log', level=logging.INFO, format='%(message)s')
-    name_array = str(['Sensor 1', 'Sensor 2', 'Sensor 3', 'Sensor 4', 'Sensor 5',
-                      'Sensor 6'])[1:-1]
-    logging.info(name_array)  # to log output values
+plt_err = False  # if true print the corrected error values instead
+array_dimension = 6     # same value this many frames in a row means the sensor is stuck (checked on every frame)
+heatmap = False     # one heatmap of all the sensors instead of one subplot each, for large arrays
+waterfall_length = 200  # frames of history under the heatmap, 0 for none
+heatmap_interval = 30   # [ms] heatmap and waterfall take about 25 ms per frame whatever the sensor count, ~30 fps at most
+ringLength = 65536   # frames kept for the waterfall when the plot falls behind
+metrics_port = None     # e.g. 9100: Prometheus text metrics on http://127.0.0.1:metrics_port/metrics
 
 class serialPlot:
     def __init__(self, serialPort='/dev/ttyUSB0', serialBaud=38400, plotLength=100, dataNumBytes=2, numPlots=1):
@@ -30,14 +39,26 @@ class serialPlot:
         self.plotMaxLength = plotLength
         self.dataNumBytes = dataNumBytes
         self.numPlots = numPlots
-        self.rawData = bytearray(numPlots * dataNumBytes)
+        self.parser = frameParser(numPlots * dataNumBytes)     # every frame carries one sample of all the channels
         self.dataType = None
         if dataNumBytes == 2:
             self.dataType = 'h'     # 2 byte integer
         elif dataNumBytes == 4:
             self.dataType = 'f'     # 4 byte float
+        self.frames = frameBuffer(numPlots * dataNumBytes, self.dataType)   # latest frame, shared by all the plots
+        self.schema = frameSchema.uniform(numPlots, self.dataType)
+        self.samples = sampleRing(numPlots, ringLength, np.dtype(self.dataType))   # every frame, for the waterfall
+        self.health = healthMonitor(numPlots, array_dimension)    # per channel stuck detection
+        self.valid = np.ones(numPlots, bool)     # of the newest frame, set by the reader thread
+        self.logData = [0] * numPlots   # latest plotted value of every sensor
+        self.logger = None
+        if log:     # binary session log, one record per received frame, written by a background thread
+            columns = [('timestamp', np.int64), ('seq', np.int64)]     # arrival time, frame counter of the board
+            columns += [('Sensor ' + str(i + 1), self.dataType) for i in range(numPlots)]  # raw, as received
+            columns += [('Sensor ' + str(i + 1) + ' corrected', self.dataType) for i in range(numPlots)]
+            self.logger = sessionLogger(time.strftime('session_%Y%m%d_%H%M%S.bin'), columns, log_interval,
+                                        {'port': serialPort, 'limit': limit})
         self.data = []
-        self.privateData = None     # for storing a copy of the data so all plots are synchronized
         for i in range(numPlots):   # give an array for each type of data and store them in a list
             self.data.append(collections.deque([0] * plotLength, maxlen=plotLength))
         self.isRun = True
@@ -45,6 +66,16 @@ class serialPlot:
         self.thread = None
         self.plotTimer = 0
         self.previousTimer = 0
+        self.metrics = metrics.metricsRegistry()   # the animation adds its frame rate and render time
+        metrics.watchParser(self.metrics, self.parser)
+        metrics.watchRing(self.metrics, self.samples)
+        if self.logger is not None:
+            metrics.watchLogger(self.metrics, self.logger)
+        if metrics_port is not None:
+            try:
+                print('Metrics on http://%s:%d/metrics' % self.metrics.serve(metrics_port))
+            except OSError as error:
+                print('No metrics endpoint: ' + str(error))
 
         print('Trying to connect to: ' + str(serialPort) + ' at ' + str(serialBaud) + ' BAUD.')
         try:
@@ -61,58 +92,86 @@ class serialPlot:
             while self.isReceiving != True:
                 time.sleep(0.1)
 
-    def getSerialData(self, frame, lines, lineLabel, pltNumber):
-        if pltNumber == 0:  # in order to make all the clocks show the same reading
-            currentTimer = time.perf_counter()
-            self.plotTimer = int((currentTimer - self.previousTimer) * 1000)     # the first reading will be erroneous
-            self.previousTimer = currentTimer
-        self.privateData = copy.deepcopy(self.rawData)    # so that the 3 values in our plots will be synchronized to the same sample time
-        data = self.privateData[(pltNumber*self.dataNumBytes):(self.dataNumBytes + pltNumber*self.dataNumBytes)]
-        value,  = struct.unpack(self.dataType, data)
-        value_array = []
-        if value > limit:
-            value = limit
-        value_array.append(value)
-
-        min_value = min(value_array)
-        if plt_err:
-            saved_data.append(min_value)  # add last value to array
-            saved_data.pop(0)  # remove first value of array
-            saved_value = 0
-            for x in range(array_dimension):
-                saved_value = saved_value + saved_data[x]
-            if saved_data[0] * array_dimension - saved_value == 0:  # if we measure the same values the sensor is stuck
+    def getSerialData(self, lines):
+        # one call per animation frame updates all the plots
+        currentTimer = time.perf_counter()
+        self.plotTimer = int((currentTimer - self.previousTimer) * 1000)     # the first reading will be erroneous
+        self.previousTimer = currentTimer
+        number, values = self.frames.read()    # decoded once per frame, so all the plots show the same sample
+        for pltNumber in range(self.numPlots):
+            value = values[pltNumber]
+            if value > limit:
+                value = limit
+
+            min_value = value
+            if plt_err and not self.valid[pltNumber]:  # the sensor is stuck
                 min_value = limit
 
-        self.data[pltNumber].append(value)    # we get the latest data point and append it to our array
-        lines.set_data(range(self.plotMaxLength), self.data[pltNumber])
-
-        if obj:
-            if min_value >= 300:
-                print(0)
-            elif 150 < min_value < 300:
-                print("Object detected")
-            elif 50 < min_value < 150:
-                print("Slow")
-            elif min_value < 50:
-                print("Stop")
-
-        if log:
-            saved_data[pltNumber] = min_value
-            # print(saved_data)
-            new_value_array = str(saved_data)[1:-1]  # crate array without bracket
-            logging.info(new_value_array)  # to log output values
+            self.data[pltNumber].append(min_value)    # we get the latest data point (corrected if plt_err) and append it to our array
+            if lines is not None:
+                lines[pltNumber].set_data(range(self.plotMaxLength), self.data[pltNumber])
+
+            if obj:
+                if min_value >= 300:
+                    print(0)
+                elif 150 < min_value < 300:
+                    print("Object detected")
+                elif 50 < min_value < 150:
+                    print("Slow")
+                elif min_value < 50:
+                    print("Stop")
+
+            self.logData[pltNumber] = min_value
+        return lines
+
+    def getHeatmapData(self, grid, history, reader):
+        # same values as the line plots, drawn as one image whatever the number of sensors; the waterfall gets
+        # one row per frame received since the last animation frame
+        self.getSerialData(None)
+        grid.update(self.logData)
+        if history is not None:
+            seqs, timestamps, block = reader.drain()
+            if len(block):
+                block = np.minimum(block, limit)
+                if plt_err:     # the stuck sensors as in the line plots
+                    block = np.where(self.valid, block, limit)
+                history.update(block)
+
+    def logSamples(self, seqs, arrival, block, valid):
+        # one log record per frame: the raw values and the values clamped to limit, limit when stuck
+        records = np.empty(len(block), self.logger.dtype)
+        records['timestamp'] = arrival
+        records['seq'] = seqs
+        corrected = np.where(valid, np.minimum(block, limit), limit)
+        for i in range(self.numPlots):
+            records['Sensor ' + str(i + 1)] = block[:, i]
+            records['Sensor ' + str(i + 1) + ' corrected'] = corrected[:, i]
+        self.logger.appendBlock(records)
 
     def backgroundThread(self):    # retrieve data
         time.sleep(1.0)  # give some buffer time for retrieving data
         self.serialConnection.reset_input_buffer()
         while (self.isRun):
-            self.serialConnection.readinto(self.rawData)
-            self.isReceiving = True
+            frames = self.parser.feed(readChunk(self.serialConnection))  # drain everything waiting in one read
+            if frames:
+                arrival = time.perf_counter_ns()
+                seqs = [seq for seq, payload in frames]
+                block = self.schema.array([payload for seq, payload in frames], self.samples.values.dtype)
+                self.samples.write(seqs, block, arrival)
+                valid = self.health.updateBlock(block)  # every frame, not only the plotted ones
+                self.valid = valid[-1]
+                if self.logger is not None:
+                    self.logSamples(seqs, arrival, block, valid)
+                seq, payload = frames[-1]   # newest complete frame
+                self.frames.publish(payload)
+                self.isReceiving = True
 
     def close(self):
         self.isRun = False
         self.thread.join()
+        if self.logger is not None:
+            self.logger.close()
+        self.metrics.close()
         self.serialConnection.close()
         print('Disconnected...')
 
@@ -128,28 +187,24 @@ def makeFigure(xLimit, yLimit, title):
     return fig, ax
 
 
-def conv_num_x(argument):
-    switcher = {
-        0: 0,
-        1: 1,
-        2: 2,
-        3: 0,
-        4: 1,
-        5: 2,
-    }
-    return switcher.get(argument, 0)
-
-
-def conv_num_y(argument):
-    switcher = {
-        0: 0,
-        1: 0,
-        2: 0,
-        3: 1,
-        4: 1,
-        5: 1,
-    }
-    return switcher.get(argument, 0)
+def heatmapFigure(s, numPlots, pltInterval):
+    # one heatmap (and waterfall) for all the sensors, the cost per frame does not grow with numPlots
+    if waterfall_length:
+        fig, (ax, historyAx) = plt.subplots(2, 1, gridspec_kw={'height_ratios': [1, 2]})
+    else:
+        fig, ax = plt.subplots()
+    fig.set_figheight(8.5)
+    ax.set_title('Distance')
+    grid = taxelHeatmap(ax, numPlots, vmin=0, vmax=limit, cmap='viridis_r', labels=numPlots <= 16)
+    fig.colorbar(grid.image, ax=ax)
+    artists = grid.artists()
+    history = None
+    reader = s.samples.reader()
+    if waterfall_length:
+        history = waterfall(historyAx, numPlots, waterfall_length, vmin=0, vmax=limit, cmap='viridis_r')
+        artists += history.artists()
+    statsText = fig.text(0.01, 0.01, '')
+    return fig, blitAnimation(fig, lambda: s.getHeatmapData(grid, history, reader), artists, pltInterval, statsText)
 
 
 def main():
@@ -163,25 +218,34 @@ def main():
 
     # plotting starts below
     pltInterval = 15    # Period at which the plot animation updates [ms]
+    if heatmap:
+        fig, anim = heatmapFigure(s, numPlots, heatmap_interval)
+        metrics.watchAnimation(s.metrics, anim)
+        plt.show()
+        s.close()
+        return
+
     lineLabelText = ['Sensor 1', 'Sensor 2', 'Sensor 3','Sensor 4', 'Sensor 5', 'Sensor 6']
     style = ['r-', 'g-', 'b-', 'c-', 'm-', 'y-']    # linestyles for the different plots
-    anim = []
-    fig, ax = plt.subplots(3, 2)
+    rows, columns = gridShape(numPlots)
+    fig, ax = plt.subplots(rows, columns, squeeze=False)
     fig.set_figheight(8.5)
     fig.set_figwidth(13)
-    ax[2, 0].set_xlabel("Time")
-    ax[2, 1].set_xlabel("Time")
-    ax[0, 0].set_ylabel("Distance")
-    ax[1, 0].set_ylabel("Distance")
-    ax[2, 0].set_ylabel("Distance")
+    for column in range(columns):
+        ax[rows - 1, column].set_xlabel("Time")
+    for row in range(rows):
+        ax[row, 0].set_ylabel("Distance")
 
+    lines = []
     for i in range(numPlots):
-        argument = i
-        ax[conv_num_x(argument), conv_num_y(argument)].set_xlim([0, maxPlotLength])
-        ax[conv_num_x(argument), conv_num_y(argument)].set_ylim([-1, limit + 100])
-        ax[conv_num_x(argument), conv_num_y(argument)].set_title(lineLabelText[i])
-        lines = ax[conv_num_x(argument), conv_num_y(argument)].plot([], [], style[i])[0]
-        anim.append(animation.FuncAnimation(fig, s.getSerialData, fargs=(lines,  lineLabelText[i], i), interval=pltInterval))  # fargs has to be a tuple
+        plot = ax[gridPosition(i, rows)]
+        plot.set_xlim([0, maxPlotLength])
+        plot.set_ylim([-1, limit + 100])
+        plot.set_title(lineLabelText[i % len(lineLabelText)])
+        lines.append(plot.plot([], [], style[i % len(style)])[0])
+    statsText = fig.text(0.01, 0.01, '')    # measured frame rate and render cost
+    anim = blitAnimation(fig, lambda: s.getSerialData(lines), lines, pltInterval, statsText)   # one blitted animation for all the subplots
+    metrics.watchAnimation(s.metrics, anim)
     plt.show()
 
     s.close()
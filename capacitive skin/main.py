@@ -6,15 +6,24 @@ import time
 import collections
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-import struct
+import numpy as np
 import logging
 import pandas as pd
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # shared serial_common package
+from serial_common.protocol import frameParser, readChunk
+from serial_common.schema import frameSchema
+from serial_common.baseline import baselineTracker
 
 limit = 300     # set sensor max output
 log = False     # enable log data
 obj = False      # print object detection
-del_err = False  # delete robot error
-del_err_val = 50  # deleted error
+del_err = False  # delete robot error: plot the value above the adaptive baseline
+baseline_alpha = 0.001  # baseline EMA weight of an untouched sample, follows drift over about 1 / alpha samples
+touch_threshold = 20    # above the baseline by more than this is a touch, the baseline is frozen meanwhile
+plot_baseline = True    # plot the baseline next to the skin value
 
 if log:
     logging.basicConfig(filename='value.log', level=logging.INFO, format='%(message)s')
@@ -25,8 +34,12 @@ class serialPlot:
         self.baud = serialBaud
         self.plotMaxLength = plotLength
         self.dataNumBytes = dataNumBytes
-        self.rawData = bytearray(dataNumBytes)
+        self.schema = frameSchema.uniform(1, 'f' if dataNumBytes == 4 else 'h')    # 4 byte float or 2 byte integer
+        self.parser = frameParser(dataNumBytes)     # one frame per sample
+        self.baseline = baselineTracker(1, baseline_alpha, touch_threshold)    # updated with every sample in the reader thread
+        self.latest = (0.0, 0.0, 0.0, False)    # value, baseline, value above the baseline, touched
         self.data = collections.deque([0] * plotLength, maxlen=plotLength)
+        self.baselineData = collections.deque([0] * plotLength, maxlen=plotLength)
         self.isRun = True
         self.isReceiving = False
         self.thread = None
@@ -54,14 +67,15 @@ class serialPlot:
         self.plotTimer = int((currentTimer - self.previousTimer) * 1000)     # the first reading will be erroneous
         self.previousTimer = currentTimer
         timeText.set_text('Plot Interval = ' + str(self.plotTimer) + 'ms')
-        value, = struct.unpack('f', self.rawData)    # use 'h' for a 2 byte integer
+        value, baseline, delta, touched = self.latest
         if del_err:
-            if value < del_err_val:
-                value = 0
-            else:
-                value = value - del_err_val
+            value = max(delta, 0)
+            baseline = 0
         self.data.append(value)    # we get the latest data point and append it to our array
-        lines.set_data(range(self.plotMaxLength), self.data)
+        self.baselineData.append(baseline)
+        lines[0].set_data(range(self.plotMaxLength), self.data)
+        if plot_baseline:
+            lines[1].set_data(range(self.plotMaxLength), self.baselineData)
         lineValueText.set_text('[' + lineLabel + '] = ' + str(value))
         # self.csvData.append(self.data[-1])
 
@@ -69,26 +83,20 @@ class serialPlot:
         if log:
             logging.info(value)
 
-        if obj:
-            if value < 20:
-                print(0)
-            # elif value > 30 and value < 40 :
-            #    print("Object detected")
-            # elif value > 40 and value < 150 :
-            #    print("Push")
-            elif value > 20 :
-                print("Object detected")
-
-
-
-
     def backgroundThread(self):    # retrieve data
         time.sleep(1.0)  # give some buffer time for retrieving data
         self.serialConnection.reset_input_buffer()
         while (self.isRun):
-            self.serialConnection.readinto(self.rawData)
-            self.isReceiving = True
-            #print(self.rawData)
+            frames = self.parser.feed(readChunk(self.serialConnection))  # drain everything waiting in one read
+            if frames:
+                values = self.schema.array([payload for seq, payload in frames])
+                deltas, touched, baselines = self.baseline.updateBlock(values)    # every sample, not only the plotted ones
+                if obj:
+                    changes = np.flatnonzero(np.diff(np.concatenate(([self.latest[3]], touched[:, 0]))))
+                    for i in changes:   # print only when the touch state changes
+                        print('Object detected' if touched[i, 0] else 0)
+                self.latest = (float(values[-1, 0]), float(baselines[-1, 0]), float(deltas[-1, 0]), bool(touched[-1, 0]))
+                self.isReceiving = True
 
     def close(self):
         self.isRun = False
@@ -121,7 +129,9 @@ def main():
 
     lineLabel = 'Capacitive Skin Value'
     timeText = ax.text(0.50, 0.95, '', transform=ax.transAxes)
-    lines = ax.plot([], [], label=lineLabel)[0]
+    lines = [ax.plot([], [], label=lineLabel)[0]]
+    if plot_baseline:
+        lines.append(ax.plot([], [], '--', label='Baseline')[0])
     lineValueText = ax.text(0.50, 0.90, '', transform=ax.transAxes)
     anim = animation.FuncAnimation(fig, s.getSerialData, fargs=(lines, lineValueText, lineLabel, timeText), interval=pltInterval) # fargs has to be a tuple
 
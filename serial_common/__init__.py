@@ -0,0 +1 @@
+# shared code for the serialPlot scripts (Tof_sensor*, capacitive skin)
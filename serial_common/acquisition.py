@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# Acquisition in its own process: read, decode, timestamp, health correction and zone detection run there,
+# away from the GIL of the GUI, and every sample (raw and corrected channels) goes to a sharedRing.
+# The zone events come back through a multiprocessing queue, the parser and clock statistics through the
+# counter slots of the ring header.
+
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+import serial
+
+from serial_common.detection import zoneDetector
+from serial_common.filters import parseFilters
+from serial_common.pipeline import tofPipeline
+from serial_common.protocol import frameParser, readChunk
+from serial_common.schema import frameSchema
+from serial_common.sharedring import sharedRing
+from serial_common.timing import sampleClock
+
+
+def acquire(ringName, port, baud, numChannels, dataType, settings, events):
+    # body of the acquisition process, until the stop slot of the ring is set
+    ring = sharedRing(ringName)
+    schema = frameSchema.uniform(numChannels, dataType)
+    parser = frameParser(schema.size)
+    clock = sampleClock()
+    detector = zoneDetector(settings.get('zones', (50, 150, 300)), hysteresis=settings.get('hysteresis', 10), queue=events)
+    filters = parseFilters(settings['filters'], numChannels) if settings.get('filters') else None
+    pipeline = tofPipeline(numChannels, settings.get('limit', 1000), settings.get('window', 15), settings.get('low'),
+                           settings.get('high'), settings.get('dropoutValue'), settings.get('maxVariance'), detector, filters)
+    connection = serial.Serial(port, baud, timeout=0.05)    # short, so the stop request is seen promptly
+    connection.reset_input_buffer()
+    loops = 0
+    try:
+        while not ring.get('stop'):
+            loops += 1
+            frames = parser.feed(readChunk(connection))
+            if frames:
+                arrival = time.perf_counter_ns()
+                times, counters = clock.update(arrival, [seq for seq, payload in frames])
+                block = schema.array([payload for seq, payload in frames], ring.values.dtype)
+                clamped, corrected, min_original, min_values = pipeline.processBlock(block, counters, times)
+                ring.write(counters, np.hstack((block, corrected)).astype(block.dtype), times)
+                for field, value in (('bytes_read', parser.bytesRead), ('frames', parser.frames),
+                                     ('checksum_errors', parser.checksumErrors), ('resyncs', parser.resyncs),
+                                     ('skipped_bytes', parser.skippedBytes), ('seq_gaps', parser.seqGaps),
+                                     ('rate_mhz', int(clock.rate() * 1000)), ('jitter_ns', int(clock.jitter())),
+                                     ('gaps', clock.gaps), ('lost_frames', clock.lostFrames)):
+                    ring.set(field, value)
+            ring.set('reader_loops', loops)
+    finally:
+        connection.close()
+        print('Acquisition process: detection latency ' + str(detector.latencyStats()))
+        ring.close()
+
+
+class sharedParserCounters:
+    # the frameParser counters of the acquisition process, read from the ring header
+    def __init__(self, ring):
+        self.ring = ring
+
+    bytesRead = property(lambda self: self.ring.get('bytes_read'))
+    frames = property(lambda self: self.ring.get('frames'))
+    checksumErrors = property(lambda self: self.ring.get('checksum_errors'))
+    resyncs = property(lambda self: self.ring.get('resyncs'))
+    skippedBytes = property(lambda self: self.ring.get('skipped_bytes'))
+    seqGaps = property(lambda self: self.ring.get('seq_gaps'))
+
+
+class sharedClock:
+    # the sampleClock statistics of the acquisition process
+    def __init__(self, ring):
+        self.ring = ring
+
+    gaps = property(lambda self: self.ring.get('gaps'))
+    lostFrames = property(lambda self: self.ring.get('lost_frames'))
+
+    def rate(self):
+        return self.ring.get('rate_mhz') / 1000
+
+    def jitter(self):
+        return float(self.ring.get('jitter_ns'))
+
+    def stats(self):
+        return {'rate_hz': self.rate(), 'jitter_ms': self.jitter() / 1e6, 'gaps': self.gaps,
+                'lost_frames': self.lostFrames}
+
+
+class acquisitionProcess:
+    def __init__(self, port, baud, numChannels, dataType='h', capacity=65536, settings=None):
+        # settings: limit, window, low, high, dropoutValue, maxVariance, zones, hysteresis, filters of the pipeline
+        self.ring = sharedRing(None, 2 * numChannels, capacity, dataType, create=True)    # raw, then corrected channels
+        self.events = multiprocessing.Queue()   # zoneEvents of the detector in the acquisition process
+        self.parser = sharedParserCounters(self.ring)
+        self.clock = sharedClock(self.ring)
+        self.process = multiprocessing.Process(target=acquire, daemon=True,
+                                               args=(self.ring.name, port, baud, numChannels, dataType,
+                                                     dict(settings or {}), self.events))
+
+    def start(self):
+        self.process.start()
+
+    def readerLoops(self):
+        return self.ring.get('reader_loops')
+
+    def dispatch(self, detector):
+        # hand the events of the acquisition process to a local detector (its callbacks, counts and latencies)
+        while True:
+            try:
+                detector.emit(self.events.get_nowait())
+            except queue.Empty:
+                return
+
+    def stop(self):
+        self.ring.set('stop', 1)
+        self.process.join(2)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def close(self):
+        self.stop()
+        self.events.close()
+        self.ring.close()
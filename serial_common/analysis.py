@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# Offline analysis of recorded sessions: per channel statistics, stuck sensor intervals, time spent in every
+# detection zone and the timeline of the zone transitions. Every file is streamed in chunks (binary session
+# logs memory mapped, text value.log files through the C parser of pandas), so memory does not grow with the
+# file size, and the files are spread over a process pool.
+#
+#   python -m serial_common.analysis session_*.bin value.log --workers 8 --timeline reports/ --json summary.json
+
+import argparse
+import concurrent.futures
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from serial_common.detection import zoneDetector
+from serial_common.replay import CHUNK, captureBlocks, readText, recordingKind, sampleTimes
+from serial_common.sessionlog import readSession
+
+BINS = 1 << 13  # histogram bins for the percentiles, one per unit of the raw ToF range
+
+
+class channelStats:
+    # count, missing, min, max, mean and standard deviation merged chunk by chunk (Chan et al.), percentiles
+    # from a fixed histogram over [low, high)
+    def __init__(self, numChannels, low=0, high=BINS):
+        self.count = np.zeros(numChannels, np.int64)
+        self.missing = np.zeros(numChannels, np.int64)
+        self.low = np.full(numChannels, np.inf)
+        self.high = np.full(numChannels, -np.inf)
+        self.mean = np.zeros(numChannels)
+        self.m2 = np.zeros(numChannels)
+        self.range = (low, high)
+        self.histogram = np.zeros((numChannels, BINS), np.int64)
+
+    def update(self, values):
+        present = ~np.isnan(values)
+        count = present.sum(axis=0)
+        self.missing += len(values) - count
+        if not count.any():
+            return
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nansum(values, axis=0) / count
+            m2 = np.nansum((values - mean) ** 2, axis=0)
+        total = self.count + count
+        delta = np.nan_to_num(mean - self.mean)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(count > 0, self.mean + delta * count / total, self.mean)
+            self.m2 = np.where(count > 0, self.m2 + np.nan_to_num(m2) + delta ** 2 * self.count * count / total, self.m2)
+        self.count = total
+        self.low = np.fmin(self.low, np.nanmin(np.where(present, values, np.inf), axis=0))
+        self.high = np.fmax(self.high, np.nanmax(np.where(present, values, -np.inf), axis=0))
+        low, high = self.range
+        scaled = (values - low) * (BINS / (high - low))
+        for channel in range(values.shape[1]):
+            bins = np.clip(scaled[present[:, channel], channel], 0, BINS - 1).astype(np.int64)
+            self.histogram[channel] += np.bincount(bins, minlength=BINS)
+
+    def percentile(self, channel, fraction):
+        if not self.count[channel]:
+            return None
+        index = int(np.searchsorted(np.cumsum(self.histogram[channel]), fraction * self.count[channel]))
+        low, high = self.range
+        return low + index * (high - low) / BINS
+
+    def summary(self, names):
+        result = {}
+        for i, name in enumerate(names):
+            present = bool(self.count[i])
+            result[name] = {'count': int(self.count[i]), 'missing': int(self.missing[i]),
+                            'min': float(self.low[i]) if present else None,
+                            'max': float(self.high[i]) if present else None,
+                            'mean': float(self.mean[i]) if present else None,
+                            'std': float(np.sqrt(self.m2[i] / self.count[i])) if present else None,
+                            'p50': self.percentile(i, 0.5), 'p99': self.percentile(i, 0.99)}
+        return result
+
+
+class stuckTracker:
+    # runs of the same value at least window samples long, across the chunk borders
+    def __init__(self, numChannels, window=15):
+        self.window = window
+        self.runs = [None] * numChannels     # open run of every channel: [value, start time, samples]
+        self.intervals = []     # (channel, start ns, end ns, samples, value)
+
+    def update(self, times, values):
+        for channel in range(values.shape[1]):
+            column = values[:, channel]
+            starts = np.concatenate(([0], np.flatnonzero(column[1:] != column[:-1]) + 1))
+            lengths = np.diff(np.append(starts, len(column)))
+            run = self.runs[channel]
+            if run is not None and run[0] == column[0]:     # the first run continues the open one
+                lengths[0] += run[2]
+                first = run[1]
+            else:
+                if run is not None:
+                    self.close(channel, run, int(times[0]))
+                first = int(times[0])
+            for index in np.flatnonzero(lengths[:-1] >= self.window).tolist():
+                start = first if index == 0 else int(times[starts[index]])
+                self.intervals.append((channel, start, int(times[starts[index + 1]]), int(lengths[index]),
+                                       float(column[starts[index]])))
+            last = len(starts) - 1
+            self.runs[channel] = [column[-1], first if last == 0 else int(times[starts[last]]), int(lengths[last])]
+
+    def close(self, channel, run, end):
+        if run[2] >= self.window and run[0] == run[0]:  # NaN is a dropout, not a stuck value
+            self.intervals.append((channel, run[1], end, run[2], float(run[0])))
+
+    def finish(self, end):
+        for channel, run in enumerate(self.runs):
+            if run is not None:
+                self.close(channel, run, end)
+        self.runs = [None] * len(self.runs)
+        self.intervals.sort(key=lambda interval: interval[1])
+
+
+class zoneTimeline:
+    # zoneDetector over the min distance of every sample; only the samples where the raw zone or the zone
+    # after the hysteresis margin changes can move the state machine, the rest is skipped vectorized
+    def __init__(self, thresholds=(50, 150, 300), hysteresis=10):
+        self.thresholds = np.asarray(thresholds, np.float64)
+        self.hysteresis = hysteresis
+        self.detector = zoneDetector(thresholds, hysteresis=hysteresis)
+        self.events = []
+        self.detector.subscribe(self.events.append)
+        self.previous = None    # (zone, zone with the margin) of the last sample
+
+    def update(self, times, distances):
+        present = ~np.isnan(distances)
+        times, distances = times[present], distances[present]
+        if not len(distances):
+            return
+        zones = np.searchsorted(self.thresholds, distances, side='right')
+        margins = np.searchsorted(self.thresholds, distances - self.hysteresis, side='right')
+        changed = np.empty(len(zones), bool)
+        changed[1:] = (zones[1:] != zones[:-1]) | (margins[1:] != margins[:-1])
+        changed[0] = self.previous != (zones[0], margins[0])
+        for index in np.flatnonzero(changed).tolist():
+            self.detector.update(float(distances[index]), None, int(times[index]))   # the recording time as arrival
+        self.previous = (zones[-1], margins[-1])
+
+    def dwell(self, end):
+        # seconds spent in every zone
+        dwell = {}
+        for event, following in zip(self.events, self.events[1:] + [None]):
+            stop = end if following is None else following.arrival
+            dwell[str(event.label)] = dwell.get(str(event.label), 0.0) + (stop - event.arrival) / 1e9
+        return dwell
+
+
+def sessionFrames(path, dataType='h', rate=None, chunkSize=CHUNK):
+    # (timestamps ns, DataFrame of the value columns, meta) chunks of a recording of any kind
+    kind = recordingKind(path)
+    if kind == 'session':
+        header, records = readSession(path)
+        names = [name for name in records.dtype.names if name not in ('timestamp', 'seq', 'frame')]
+        for start in range(0, len(records), chunkSize):
+            chunk = records[start:start + chunkSize]
+            if 'timestamp' in records.dtype.names:
+                times = np.asarray(chunk['timestamp'], np.int64)
+            else:
+                times = sampleTimes(start, len(chunk), rate)
+            yield times, pd.DataFrame({name: np.asarray(chunk[name], np.float64) for name in names}), header['meta']
+    elif kind == 'capture':
+        for times, seqs, values in captureBlocks(path, dataType, rate):
+            yield times, pd.DataFrame(values.astype(np.float64), columns=['Sensor ' + str(i + 1) for i in range(values.shape[1])]), {}
+    else:
+        count = 0
+        for frame in readText(path, chunkSize):
+            yield sampleTimes(count, len(frame), rate), frame, {}
+            count += len(frame)
+
+
+def minDistance(frame, raw, limit):
+    # the min distance the detection used: logged, else from the corrected columns, else the clamped raw values
+    if 'Min value correct' in frame.columns:
+        return frame['Min value correct'].to_numpy()
+    corrected = [name for name in frame.columns if name.endswith('corrected')]
+    if corrected:
+        return np.fmin.reduce(frame[corrected].to_numpy(), axis=1)
+    return np.fmin.reduce(np.minimum(frame[raw].to_numpy(), limit), axis=1)
+
+
+def analyseFile(path, options):
+    # summary dict of one recording; options as parsed by main()
+    start = time.perf_counter()
+    stats = stuck = zones = None
+    names = []
+    samples = 0
+    first = last = None
+    for times, frame, meta in sessionFrames(path, options['type'], options['rate'], options['chunk']):
+        if not len(frame):
+            continue
+        if stats is None:
+            def option(key, default):
+                return options[key] if options.get(key) is not None else meta.get(key, default)
+            names = [name for name in frame.columns if name.startswith('Sensor') and not name.endswith('corrected')]
+            low, high = option('range', (0, BINS - 1))
+            limit = option('limit', 1000)
+            stats = channelStats(len(names), low, high + 1)    # the valid range includes high
+            stuck = stuckTracker(len(names), option('array_dimension', 15))
+            zones = zoneTimeline(option('zones', (50, 150, 300)), option('hysteresis', 10))
+            first = int(times[0])
+        values = frame[names].to_numpy(np.float64)
+        stats.update(values)
+        stuck.update(times, values)
+        zones.update(times, minDistance(frame, names, limit).astype(np.float64))
+        samples += len(frame)
+        last = int(times[-1])
+    summary = {'path': path, 'kind': recordingKind(path), 'samples': samples, 'duration_s': 0.0, 'channels': {},
+               'stuck': [], 'transitions': 0, 'dwell_s': {}, 'events': []}
+    if stats is not None:
+        stuck.finish(last)
+        summary.update(duration_s=(last - first) / 1e9, channels=stats.summary(names), transitions=len(zones.events),
+                       dwell_s=zones.dwell(last),
+                       stuck=[{'channel': names[channel], 'start_s': (begin - first) / 1e9, 'end_s': (end - first) / 1e9,
+                               'samples': count, 'value': value} for channel, begin, end, count, value in stuck.intervals],
+                       events=[{'time_s': (event.arrival - first) / 1e9, 'zone': str(event.label),
+                                'previous': str(event.previous), 'distance': event.distance} for event in zones.events])
+    summary['elapsed_s'] = time.perf_counter() - start
+    if options.get('timeline'):
+        writeTimeline(summary, options['timeline'])
+    if not options.get('keep_events'):
+        summary['events'] = len(summary['events'])     # the timeline files have them
+    return summary
+
+
+def writeTimeline(summary, directory):
+    # <recording>.events.csv and <recording>.stuck.csv next to each other in directory
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, os.path.basename(summary['path']))
+    pd.DataFrame(summary['events'], columns=['time_s', 'zone', 'previous', 'distance']).to_csv(base + '.events.csv', index=False)
+    pd.DataFrame(summary['stuck'], columns=['channel', 'start_s', 'end_s', 'samples', 'value']).to_csv(base + '.stuck.csv', index=False)
+
+
+def report(summary):
+    lines = [summary['path'] + ' (' + summary['kind'] + '): ' + str(summary['samples']) + ' samples, ' +
+             '%.1f' % summary['duration_s'] + ' s recorded, analysed in ' + '%.2f' % summary['elapsed_s'] + ' s']
+    for name, channel in summary['channels'].items():
+        if channel['count']:
+            lines.append('  %-12s min %8.1f  max %8.1f  mean %8.1f  std %7.1f  p50 %7.1f  p99 %7.1f  missing %d' %
+                         (name, channel['min'], channel['max'], channel['mean'], channel['std'], channel['p50'],
+                          channel['p99'], channel['missing']))
+        else:
+            lines.append('  %-12s no samples' % name)
+    stuck = {}
+    for interval in summary['stuck']:
+        stuck[interval['channel']] = stuck.get(interval['channel'], 0.0) + interval['end_s'] - interval['start_s']
+    lines.append('  stuck: ' + (', '.join(name + ' ' + str(sum(1 for interval in summary['stuck'] if interval['channel'] == name)) +
+                                          ' intervals ' + '%.1f' % seconds + ' s' for name, seconds in stuck.items()) or 'none'))
+    lines.append('  ' + str(summary['transitions']) + ' zone transitions, dwell [s]: ' +
+                 ', '.join(label + ' ' + '%.1f' % seconds for label, seconds in summary['dwell_s'].items()))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Statistics, stuck sensors and zone dwell of recorded sessions')
+    parser.add_argument('paths', nargs='+', help='binary session logs, raw captures or text value.log files')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes analysing files in parallel')
+    parser.add_argument('--chunk', type=int, default=1 << 20, help='samples read at a time')
+    parser.add_argument('--type', default='h', choices=['h', 'f'], help='data type of raw captures')
+    parser.add_argument('--rate', type=float, help='sample rate of recordings without timestamps')
+    parser.add_argument('--limit', type=float, help='sensor max output (default: from the session, else 1000)')
+    parser.add_argument('--array-dimension', type=int, help='samples of the same value that mean a stuck sensor')
+    parser.add_argument('--range', type=float, nargs=2, help='value range of the percentile histogram')
+    parser.add_argument('--zones', type=float, nargs='+', help='zone borders, closest first')
+    parser.add_argument('--hysteresis', type=float)
+    parser.add_argument('--timeline', help='directory for the zone event and stuck interval CSV files of every recording')
+    parser.add_argument('--json', help='write all the summaries, with the events, to this file')
+    args = parser.parse_args()
+    options = {'chunk': args.chunk, 'type': args.type, 'rate': args.rate, 'limit': args.limit,
+               'array_dimension': args.array_dimension, 'range': args.range, 'zones': args.zones,
+               'hysteresis': args.hysteresis, 'timeline': args.timeline, 'keep_events': bool(args.json)}
+    start = time.perf_counter()
+    summaries = []
+    if args.workers > 1 and len(args.paths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(min(args.workers, len(args.paths))) as pool:
+            futures = [pool.submit(analyseFile, path, options) for path in args.paths]
+            for future in futures:
+                summaries.append(future.result())
+                print(report(summaries[-1]))
+    else:
+        for path in args.paths:
+            summaries.append(analyseFile(path, options))
+            print(report(summaries[-1]))
+    elapsed = time.perf_counter() - start
+    samples = sum(summary['samples'] for summary in summaries)
+    print(str(len(summaries)) + ' recordings, ' + str(samples) + ' samples in ' + '%.2f' % elapsed + ' s = ' +
+          '%.0f' % (samples / elapsed if elapsed else 0.0) + ' samples/s')
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summaries, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
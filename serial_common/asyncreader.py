@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# asyncio version of the serialPlot reader for async applications (e.g. the robot controller): no thread,
+# the event loop calls us when the port file descriptor is readable, so nothing ever blocks on the port
+# timeout and close() / task cancellation take effect at once. Same framing and decoding as the scripts.
+#
+#   async with asyncSerialReader('/dev/ttyUSB0', 3) as reader:
+#       await reader.firstFrame(2.0)        # asyncio.TimeoutError if the board stays silent
+#       async for seqs, arrival, block in reader:
+#           ...
+#
+# Where the loop cannot watch the port (Windows, ProactorEventLoop) the port is polled from a task instead.
+
+import asyncio
+import time
+
+import serial
+
+from serial_common.protocol import frameParser
+from serial_common.schema import frameSchema
+
+
+class asyncSerialReader:
+    def __init__(self, port, channels, dataType='h', baud=115200, maxBlocks=1024, pollInterval=0.001):
+        self.port = port
+        self.baud = baud
+        self.dataType = dataType
+        self.schema = channels if isinstance(channels, frameSchema) else frameSchema.uniform(channels, dataType)   # or a mixed layout
+        self.channels = len(self.schema.fields)
+        self.parser = frameParser(self.schema.size)
+        self.maxBlocks = maxBlocks      # decoded blocks kept for a consumer that falls behind
+        self.pollInterval = pollInterval
+        self.connection = None
+        self.loop = None
+        self.fd = None
+        self.pollTask = None
+        self.blocks = None
+        self.first = None       # future resolved by the first decoded frame
+        self.callbacks = []
+        self.dropped = 0        # blocks thrown away because the queue was full
+        self.isRun = False
+
+    def subscribe(self, callback):
+        # callback(seqs, arrival, block) called from the event loop for every read that decoded frames
+        self.callbacks.append(callback)
+
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        self.blocks = asyncio.Queue(self.maxBlocks)
+        self.first = self.loop.create_future()
+        self.connection = serial.Serial(self.port, self.baud, timeout=0)    # never blocks, we only read what is there
+        self.connection.reset_input_buffer()
+        self.isRun = True
+        try:
+            self.fd = self.connection.fileno()
+            self.loop.add_reader(self.fd, self.onReadable)
+        except (AttributeError, NotImplementedError):
+            self.fd = None
+            self.pollTask = self.loop.create_task(self.poll())
+        return self
+
+    async def poll(self):
+        while self.isRun:
+            if not self.onReadable():
+                await asyncio.sleep(self.pollInterval)
+
+    def onReadable(self):
+        # read and decode everything waiting, returns the number of frames
+        try:
+            chunk = self.connection.read(self.connection.in_waiting or 1)
+        except (serial.SerialException, OSError) as error:
+            self.fail(error)
+            return 0
+        frames = self.parser.feed(chunk) if chunk else []
+        if not frames:
+            return 0
+        arrival = time.perf_counter_ns()
+        seqs = [seq for seq, payload in frames]
+        block = self.schema.array([payload for seq, payload in frames])
+        if not self.first.done():
+            self.first.set_result((seqs[0], arrival, block[0]))
+        self.push((seqs, arrival, block))
+        for callback in self.callbacks:
+            try:
+                callback(seqs, arrival, block)
+            except Exception as error:
+                print('Reader callback failed: ' + repr(error))
+        return len(frames)
+
+    def fail(self, error):
+        print('Lost ' + str(self.port) + ': ' + str(error))
+        if not self.first.done():
+            self.first.set_exception(error)
+            self.first.exception()  # retrieved: no "exception was never retrieved" when nobody awaits firstFrame
+        self.stopReading()
+        self.push(None)
+
+    def push(self, item):
+        # None marks the end of the stream for read()
+        if self.blocks.full():
+            self.blocks.get_nowait()
+            self.dropped += 1
+        self.blocks.put_nowait(item)
+
+    async def firstFrame(self, timeout=None):
+        # (seq, arrival, values) of the first frame; asyncio.TimeoutError if none arrives within timeout seconds
+        return await asyncio.wait_for(asyncio.shield(self.first), timeout)
+
+    async def read(self):
+        # next (seqs, arrival ns, block) of decoded frames, None once the reader is closed
+        if not self.isRun and self.blocks.empty():
+            return None
+        return await self.blocks.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.read()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    def stopReading(self):
+        self.isRun = False
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.fd = None
+        if self.pollTask is not None:
+            self.pollTask.cancel()
+            self.pollTask = None
+
+    async def close(self):
+        # immediate: nothing is waiting on the port, only the watch on the descriptor has to go
+        if self.connection is None:
+            return
+        wasRunning = self.isRun
+        self.stopReading()
+        if wasRunning:
+            self.push(None)     # wakes up a consumer waiting in read()
+        if not self.first.done():
+            self.first.cancel()
+        self.connection.close()
+        self.connection = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
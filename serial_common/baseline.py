@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# Adaptive baseline of capacitive pads: a slow EMA of the untouched signal follows the temperature and
+# humidity drift, touch is detected on the signal above that baseline and freezes it, so a long touch is not
+# learned as the new baseline. O(1) per sample, vectorized across the pads.
+
+import numpy as np
+
+
+class baselineTracker:
+    def __init__(self, numChannels=1, alpha=0.001, touchThreshold=20.0, releaseThreshold=None, warmup=50,
+                 maxTouch=None):
+        self.numChannels = numChannels
+        self.alpha = alpha      # EMA weight of a new untouched sample: time constant of about 1 / alpha samples
+        self.touchThreshold = touchThreshold    # above the baseline by more than this: touched
+        self.releaseThreshold = touchThreshold / 2 if releaseThreshold is None else releaseThreshold
+        self.warmup = warmup    # first samples of every pad averaged to start its baseline, assumed untouched
+        self.maxTouch = maxTouch    # samples after which a touch is taken as a baseline step, None to never
+        self.baseline = np.zeros(numChannels)
+        self.counts = np.zeros(numChannels, np.int64)     # warmup samples seen per pad, NaN ones not counted
+        self.touched = np.zeros(numChannels, bool)
+        self.touchRuns = np.zeros(numChannels, np.int64)
+        self.touches = np.zeros(numChannels, np.int64)    # touches started per pad
+
+    def update(self, values):
+        # add one sample of every pad, returns (signal above the baseline, touched mask)
+        values = np.asarray(values, np.float64)
+        present = ~np.isnan(values)
+        warming = self.counts < self.warmup     # every pad warms up on its own present samples
+        delta = np.where(warming, 0.0, values - self.baseline)
+        learning = warming & present
+        self.counts += learning
+        self.baseline = np.where(learning, self.baseline + (values - self.baseline) / np.maximum(self.counts, 1),
+                                 self.baseline)    # running mean
+        touched = np.where(self.touched, delta > self.releaseThreshold, delta > self.touchThreshold) & present & ~warming
+        self.touches += touched & ~self.touched
+        self.touchRuns = np.where(touched, self.touchRuns + 1, 0)
+        if self.maxTouch is not None:
+            stale = self.touchRuns >= self.maxTouch
+            self.baseline = np.where(stale, values, self.baseline)  # re-learn at the new level
+            delta = np.where(stale, 0.0, delta)     # on the new baseline, no EMA step with the old delta
+            touched &= ~stale
+            self.touchRuns[stale] = 0
+        self.baseline = np.where(present & ~touched & ~warming, self.baseline + self.alpha * delta, self.baseline)    # frozen while touched
+        self.touched = touched
+        return delta, touched
+
+    def updateBlock(self, block):
+        # update() on every row; returns (deltas, touched, baselines) with one row per sample
+        block = np.asarray(block, np.float64).reshape(-1, self.numChannels)
+        deltas = np.empty(block.shape)
+        touched = np.empty(block.shape, bool)
+        baselines = np.empty(block.shape)
+        for i, values in enumerate(block):     # the freeze depends on the previous sample, sequential
+            deltas[i], touched[i] = self.update(values)
+            baselines[i] = self.baseline
+        return deltas, touched, baselines
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# Benchmarks of the serialPlot stages: read loop, decode, correction, detection, logging and one render tick
+# under Agg, for several channel counts. Reports throughput, p50/p99 latency per call and the CPU use of the
+# measuring thread per stage. The render stages run the getSerialData of Tof_sensor_6subPlots.
+#
+#   python -m serial_common.benchmark --channels 1 3 6 16 64 --frames 20000 [--pty] [--json results.json]
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import struct
+import tempfile
+import time
+
+import numpy as np
+
+from serial_common.detection import zoneDetector
+from serial_common.filters import parseFilters
+from serial_common.pipeline import tofPipeline
+from serial_common.protocol import encodeFrame, frameParser, readChunk
+from serial_common.schema import frameSchema
+from serial_common.sessionlog import sessionLogger
+
+CHUNK_FRAMES = 64   # frames per read / processing call
+
+
+class memorySerial:
+    # in-memory stand-in for serial.Serial: in_waiting and read() over a prepared byte stream
+    def __init__(self, data, chunk):
+        self.data = data
+        self.position = 0
+        self.chunk = chunk      # bytes the "OS buffer" holds at every read
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk, len(self.data) - self.position)
+
+    def read(self, size=1):
+        data = self.data[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+
+def measure(name, channels, calls, itemsPerCall):
+    # run every call once, timing each; returns one result row
+    latencies = np.empty(len(calls), np.int64)
+    cpu = time.thread_time()    # this thread only, not the emulator, logger or GUI threads
+    start = time.perf_counter_ns()
+    for i, call in enumerate(calls):
+        t = time.perf_counter_ns()
+        call()
+        latencies[i] = time.perf_counter_ns() - t
+    wall = (time.perf_counter_ns() - start) / 1e9
+    cpu = time.thread_time() - cpu
+    return {'stage': name, 'channels': channels, 'seconds': wall, 'items_per_s': len(calls) * itemsPerCall / wall,
+            'p50_us': float(np.percentile(latencies, 50)) / 1000, 'p99_us': float(np.percentile(latencies, 99)) / 1000,
+            'cpu_percent': 100 * cpu / wall if wall else 0.0}
+
+
+def makeFrames(channels, count, dataType='h'):
+    encoder = struct.Struct('<' + dataType * channels)
+    rng = np.random.default_rng(0)
+    values = (500 + 450 * np.sin(np.arange(count)[:, None] / 50 + np.arange(channels)) + rng.normal(0, 3, (count, channels)))
+    values = values.astype(np.int16 if dataType == 'h' else np.float32)
+    payloads = [encoder.pack(*row) for row in values.tolist()]
+    return values, payloads, b''.join(encodeFrame(i, payload) for i, payload in enumerate(payloads))
+
+
+def benchRead(channels, frames, stream, usePty):
+    parser = frameParser(channels * 2)
+    if usePty:
+        from serial_common.emulator import sensorEmulator
+        import serial
+        emulator = sensorEmulator(channels, 'h', 0)
+        connection = serial.Serial(emulator.port, 115200, timeout=1)
+        emulator.start()
+        calls = [lambda: parser.feed(readChunk(connection))] * (frames // CHUNK_FRAMES)
+        result = measure('read loop (pty)', channels, calls, 1)
+        emulator.close()
+        connection.close()
+        result['items_per_s'] = parser.frames / result['seconds']   # frames actually decoded
+        return result
+    connection = memorySerial(stream, len(stream) // max(1, frames // CHUNK_FRAMES))
+    calls = [lambda: parser.feed(readChunk(connection))] * (frames // CHUNK_FRAMES)
+    return measure('read loop (memory)', channels, calls, CHUNK_FRAMES)
+
+
+def benchDecode(channels, payloads):
+    chunks = [payloads[i:i + CHUNK_FRAMES] for i in range(0, len(payloads), CHUNK_FRAMES)]
+
+    def perValue(chunk):   # the original getSerialData: one slice and struct.unpack per channel
+        for payload in chunk:
+            [struct.unpack('h', payload[i * 2:i * 2 + 2])[0] for i in range(channels)]
+
+    decoder = struct.Struct('<' + 'h' * channels)
+
+    def perFrame(chunk):    # the reader thread now: one precompiled Struct per frame
+        np.array([decoder.unpack(payload) for payload in chunk], np.int16)
+
+    schema = frameSchema.uniform(channels, 'h')
+
+    def batch(chunk):       # frame schema: one np.frombuffer for the whole read
+        schema.array(chunk)
+
+    return [measure('decode per value', channels, [lambda c=c: perValue(c) for c in chunks], CHUNK_FRAMES),
+            measure('decode per frame', channels, [lambda c=c: perFrame(c) for c in chunks], CHUNK_FRAMES),
+            measure('decode schema', channels, [lambda c=c: batch(c) for c in chunks], CHUNK_FRAMES)]
+
+
+def benchCorrection(channels, values):
+    pipeline = tofPipeline(channels, 1000, 15, 0, 8191)
+    blocks = [values[i:i + CHUNK_FRAMES] for i in range(0, len(values), CHUNK_FRAMES)]
+    return measure('correction', channels, [lambda b=b: pipeline.processBlock(b) for b in blocks], CHUNK_FRAMES)
+
+
+def benchFilters(channels, values, spec='gate:150:5, median:5, kalman:1:25'):
+    chain = parseFilters(spec, channels)
+    blocks = [values[i:i + CHUNK_FRAMES] for i in range(0, len(values), CHUNK_FRAMES)]
+    return measure('filters', channels, [lambda b=b: chain.process(b) for b in blocks], CHUNK_FRAMES)
+
+
+def benchDetection(channels, values):
+    detector = zoneDetector()
+    minimums = values.min(axis=1).tolist()
+    blocks = [minimums[i:i + CHUNK_FRAMES] for i in range(0, len(minimums), CHUNK_FRAMES)]
+
+    def detect(block):
+        for value in block:
+            detector.update(value)
+
+    return measure('detection', channels, [lambda b=b: detect(b) for b in blocks], CHUNK_FRAMES)
+
+
+def benchLogging(channels, values, directory):
+    blocks = [values[i:i + CHUNK_FRAMES] for i in range(0, len(values), CHUNK_FRAMES)]
+    columns = [('timestamp', np.int64)] + [('Sensor ' + str(i + 1), np.int16) for i in range(channels)]
+    logger = sessionLogger(os.path.join(directory, 'bench.bin'), columns, 0.05)
+
+    def binary(block):
+        records = np.empty(len(block), logger.dtype)
+        records['timestamp'] = time.perf_counter_ns()
+        for i in range(channels):
+            records['Sensor ' + str(i + 1)] = block[:, i]
+        logger.appendBlock(records)
+
+    text = logging.getLogger('benchmark')
+    text.propagate = False
+    handler = logging.FileHandler(os.path.join(directory, 'bench.log'))
+    text.addHandler(handler)
+    text.setLevel(logging.INFO)
+
+    def textLog(block):     # the original value.log path: str(list) and logging.info per sample
+        for row in block.tolist():
+            text.info(str(row)[1:-1])
+
+    results = [measure('logging binary', channels, [lambda b=b: binary(b) for b in blocks], CHUNK_FRAMES),
+               measure('logging text', channels, [lambda b=b: textLog(b) for b in blocks], CHUNK_FRAMES)]
+    logger.close()
+    text.removeHandler(handler)
+    handler.close()
+    return results
+
+
+def loadPlotter(channels, plotLength):
+    # the serialPlot of Tof_sensor_6subPlots, not connected: the benchmark publishes the frames itself
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Tof_sensor_6subPlots', 'main.py')
+    spec = importlib.util.spec_from_file_location('subplots', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    with contextlib.redirect_stdout(io.StringIO()):
+        plotter = module.serialPlot(None, 115200, plotLength, 2, channels)
+    return module, plotter
+
+
+def benchRender(channels, values, payloads, ticks, plotLength=100):
+    # one tick of the real plot update: getSerialData of the subplots with a full draw (FuncAnimation without
+    # blit) and with blitAnimation, then the heatmap and waterfall figure
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from serial_common.render import blitAnimation
+
+    module, plotter = loadPlotter(channels, plotLength)
+    counter = iter(range(10 ** 9))
+
+    def receive():  # what the reader thread does for one frame
+        tick = next(counter) % len(payloads)
+        plotter.samples.write(tick, values[tick], time.perf_counter_ns())
+        plotter.frames.publish(payloads[tick])
+
+    rows, columns = module.gridShape(channels)
+    fig, ax = plt.subplots(rows, columns, squeeze=False)
+    lines = []
+    for i in range(channels):
+        plot = ax[module.gridPosition(i, rows)]
+        plot.set_xlim(0, plotLength)
+        plot.set_ylim(-1, module.limit + 100)
+        lines.append(plot.plot([], [])[0])
+    full = measure('render full draw', channels, [lambda: (receive(), plotter.getSerialData(lines), fig.canvas.draw())] * ticks, 1)
+    anim = blitAnimation(fig, lambda: (receive(), plotter.getSerialData(lines)), lines, 1000)
+    anim.timer.stop()
+    fig.canvas.draw()
+    blit = measure('render blit', channels, [anim.step] * ticks, 1)
+    plt.close(fig)
+
+    fig, anim = module.heatmapFigure(plotter, channels, 1000)
+    anim.update = lambda update=anim.update: (receive(), update())
+    anim.timer.stop()
+    fig.canvas.draw()
+    heatmap = measure('render heatmap', channels, [anim.step] * ticks, 1)
+    plt.close(fig)
+    return [full, blit, heatmap]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the serial -> detection -> plot pipeline')
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 3, 6, 16, 64])
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--ticks', type=int, default=50, help='render ticks per channel count')
+    parser.add_argument('--pty', action='store_true', help='also measure the read loop on an emulated pty')
+    parser.add_argument('--no-render', action='store_true')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for channels in args.channels:
+            values, payloads, stream = makeFrames(channels, args.frames)
+            results.append(benchRead(channels, args.frames, stream, False))
+            if args.pty:
+                results.append(benchRead(channels, args.frames, stream, True))
+            results += benchDecode(channels, payloads)
+            results.append(benchCorrection(channels, values))
+            results.append(benchFilters(channels, values))
+            results.append(benchDetection(channels, values))
+            results += benchLogging(channels, values, directory)
+            if not args.no_render:
+                results += benchRender(channels, values, payloads, args.ticks)
+
+    print('%-20s %8s %14s %10s %10s %6s' % ('stage', 'channels', 'items/s', 'p50 us', 'p99 us', 'cpu %'))
+    for row in results:
+        print('%-20s %8d %14.0f %10.1f %10.1f %6.0f' % (row['stage'], row['channels'], row['items_per_s'],
+                                                        row['p50_us'], row['p99_us'], row['cpu_percent']))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# Display decimation: whatever the length of the plotted window, a line gets a bounded number of points.
+# minMax keeps the lowest and highest sample of every bucket (about one bucket per pixel column), so spikes
+# and dropouts stay visible; lttb (Largest Triangle Three Buckets) keeps the visually most important sample
+# of every bucket and looks closer to the raw line for smooth signals.
+
+import numpy as np
+
+
+def minMax(x, y, points):
+    # at most points samples: min and max of points // 2 buckets, in time order
+    x = np.asarray(x)
+    y = np.asarray(y)
+    count = len(y)
+    buckets = max(1, points // 2)
+    if count <= points:
+        return x, y
+    size = count // buckets
+    used = size * buckets   # the oldest count - used samples are left out, less than one bucket
+    rows = y[count - used:].reshape(buckets, size)
+    if np.issubdtype(rows.dtype, np.floating):     # NaN must not win the bucket minimum / maximum
+        missing = np.isnan(rows)
+        low = np.where(missing, np.inf, rows).argmin(axis=1)
+        high = np.where(missing, -np.inf, rows).argmax(axis=1)
+    else:
+        low = rows.argmin(axis=1)
+        high = rows.argmax(axis=1)
+    first = np.minimum(low, high)
+    second = np.maximum(low, high)
+    index = (count - used + np.arange(buckets) * size)[:, None] + np.stack((first, second), axis=1)
+    index = index.ravel()
+    return x[index], y[index]
+
+
+def lttb(x, y, points):
+    # Largest Triangle Three Buckets: keeps the first and last sample and one sample per bucket in between
+    x = np.asarray(x)
+    y = np.asarray(y)
+    count = len(y)
+    if count <= points or points < 3:
+        return x, y
+    buckets = points - 2
+    size = (count - 2) // buckets
+    first = count - 1 - size * buckets  # equal buckets, the few oldest samples beyond them are left out
+    bucketX = x[first:count - 1].astype(np.float64).reshape(buckets, size)
+    bucketY = y[first:count - 1].astype(np.float64).reshape(buckets, size)
+    missing = np.isnan(bucketY)
+    gaps = missing.any(axis=1)      # buckets with dropouts, their NaN samples are never selected
+    bucketY[missing] = 0
+    present = np.maximum(size - missing.sum(axis=1), 1)
+    meanX = np.append(bucketX.mean(axis=1)[1:], x[-1])     # third corner of the triangles: the next bucket average
+    meanY = np.nan_to_num(np.append((bucketY.sum(axis=1) / present)[1:], y[-1]))
+    index = np.empty(points, np.int64)
+    index[0] = 0
+    index[-1] = count - 1
+    selectedX, selectedY = float(x[0]), float(y[0])
+    if np.isnan(selectedY):
+        selectedY = 0.0
+    for i in range(buckets):
+        # twice the triangle area, linear in the candidate point
+        dx, dy = selectedX - meanX[i], meanY[i] - selectedY
+        area = np.abs(dx * bucketY[i] + dy * bucketX[i] - dx * selectedY - selectedX * dy)
+        if gaps[i]:
+            area[missing[i]] = -1
+        best = int(area.argmax())
+        selectedX, selectedY = bucketX[i, best], bucketY[i, best]
+        index[i + 1] = first + i * size + best
+    return x[index], y[index]
+
+
+def decimate(x, y, points, method='minmax'):
+    if method == 'lttb':
+        return lttb(x, y, points)
+    return minMax(x, y, points)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# Zone classification of the closest distance as a state machine, meant to run in the reader thread.
+# Moving to a closer zone is immediate, moving back to a safer one needs the hysteresis margin.
+# Only transitions are reported, to the registered callbacks and/or a queue.
+
+import bisect
+import collections
+import time
+
+zoneEvent = collections.namedtuple('zoneEvent', 'label previous distance seq arrival emitted')
+
+
+class zoneDetector:
+    def __init__(self, thresholds=(50, 150, 300), labels=('Stop', 'Slow', 'Object detected', 0), hysteresis=10, queue=None):
+        self.thresholds = list(thresholds)  # zone borders, closest zone first
+        self.labels = list(labels)          # one more label than thresholds
+        self.hysteresis = hysteresis
+        self.queue = queue                  # optional queue.Queue receiving the events
+        self.callbacks = []
+        self.zone = None
+        self.transitions = 0
+        self.counts = collections.Counter()     # transitions into every zone, by label
+        self.latencies = collections.deque(maxlen=4096)  # frame arrival to event, ns
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+    def label(self):
+        return None if self.zone is None else self.labels[self.zone]
+
+    def update(self, distance, seq=None, arrival=None):
+        # feed the closest distance of one frame, returns the event if the zone changed
+        zone = bisect.bisect_right(self.thresholds, distance)
+        if self.zone is not None and zone > self.zone:  # safer zone only once past the margin
+            zone = max(self.zone, bisect.bisect_right(self.thresholds, distance - self.hysteresis))
+        if zone == self.zone:
+            return None
+        previous = self.label()
+        emitted = time.perf_counter_ns()
+        if arrival is None:
+            arrival = emitted
+        event = zoneEvent(self.labels[zone], previous, distance, seq, arrival, emitted)
+        self.emit(event)
+        return event
+
+    def emit(self, event):
+        # also applies the events of a detector running in another process (see acquisitionProcess.dispatch)
+        self.zone = self.labels.index(event.label)
+        self.transitions += 1
+        self.counts[event.label] += 1
+        self.latencies.append(event.emitted - event.arrival)
+        if self.queue is not None:
+            self.queue.put_nowait(event)
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception as error:     # a broken consumer must not stop the acquisition
+                print('Detection callback failed: ' + repr(error))
+
+    def latencyStats(self):
+        # frame arrival to event latency of the last transitions, in microseconds
+        if not self.latencies:
+            return {}
+        ordered = sorted(self.latencies)
+        return {'count': self.transitions,
+                'mean_us': sum(ordered) / len(ordered) / 1000,
+                'p50_us': ordered[len(ordered) // 2] / 1000,
+                'p99_us': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] / 1000,
+                'max_us': ordered[-1] / 1000}
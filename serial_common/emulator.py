@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# Serial device emulator: streams framed ToF or capacitive frames on a pseudo terminal, so serialPlot
+# can connect to the printed port name exactly like to the Arduino. Linux / macOS only (pty).
+#
+#   python -m serial_common.emulator --channels 6 --rate 1000 --drop 0.001 --stuck 2
+#
+# Faults: --drop removes a random byte from a frame with the given probability, --stuck freezes channels,
+# --burst sends that many extra frames back to back every second.
+
+import argparse
+import math
+import os
+import pty
+import random
+import struct
+import threading
+import time
+import tty
+
+from serial_common.protocol import encodeFrame
+
+
+class sensorEmulator:
+    def __init__(self, channels=3, dataType='h', rate=100.0, profile='tof', dropRate=0.0, stuckChannels=(),
+                 burst=0, recording=None, seed=None):
+        self.channels = channels
+        self.dataType = dataType    # 'h' 2 byte integer or 'f' 4 byte float, as serialPlot.dataType
+        self.rate = rate            # frames per second, 0 for as fast as the pty accepts them
+        self.profile = profile      # 'tof' distances or 'capacitive' skin values
+        self.dropRate = dropRate
+        self.stuckChannels = set(stuckChannels)
+        self.burst = burst
+        self.random = random.Random(seed)
+        self.encoder = struct.Struct('<' + dataType * channels)
+        self.recording = None
+        if recording is not None:
+            self.recording = loadRecording(recording, channels)
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)     # a full pty drops bytes like a UART nobody reads
+        self.port = os.ttyname(self.slave)
+        self.sent = 0           # frames
+        self.burstFrames = 0    # of them sent as extra bursts, on top of the rate
+        self.bytesSent = 0
+        self.dropped = 0        # bytes removed by the fault injection
+        self.overruns = 0       # bytes the reader was too slow to take
+        self.stuckValues = {}
+        self.isRun = False
+        self.thread = None
+
+    def values(self, n):
+        # sample n of every channel
+        if self.recording is not None:
+            values = list(self.recording[n % len(self.recording)])
+        else:
+            t = n / (self.rate or 1000.0)
+            values = []
+            for i in range(self.channels):
+                if self.profile == 'capacitive':
+                    value = 50 + 5 * math.sin(t / 30 + i) + self.random.gauss(0, 1)
+                    if (t + i) % 10 < 1:    # a touch every 10 s
+                        value += 80
+                else:
+                    value = 500 + 450 * math.sin(2 * math.pi * 0.2 * t + i) + self.random.gauss(0, 3)
+                values.append(value)
+        for i in self.stuckChannels:
+            if i < self.channels:
+                values[i] = self.stuckValues.setdefault(i, values[i])
+        if self.dataType == 'h':
+            values = [max(-32768, min(32767, int(value))) for value in values]
+        return values
+
+    def frame(self, n):
+        data = encodeFrame(n, self.encoder.pack(*self.values(n)))
+        if self.dropRate and self.random.random() < self.dropRate:
+            cut = self.random.randrange(len(data))
+            data = data[:cut] + data[cut + 1:]
+            self.dropped += 1
+        return data
+
+    def write(self, data):
+        try:
+            written = os.write(self.master, data)
+        except BlockingIOError:
+            written = 0
+        self.overruns += len(data) - written
+        self.bytesSent += written
+
+    def run(self, duration=None):
+        start = time.perf_counter()
+        nextBurst = start + 1
+        while self.isRun:
+            now = time.perf_counter()
+            if duration is not None and now - start >= duration:
+                break
+            if self.rate:
+                due = int((now - start) * self.rate) - (self.sent - self.burstFrames)  # owed since the start, sent in one write
+            else:
+                due = 64
+            due = max(due, 0)
+            if self.burst and now >= nextBurst:     # extra frames, the schedule keeps its rate
+                due += self.burst
+                self.burstFrames += self.burst
+                nextBurst += 1
+            if due > 0:
+                self.write(b''.join(self.frame(self.sent + i) for i in range(due)))
+                self.sent += due
+            if self.rate:
+                time.sleep(min(0.001, 1 / self.rate))
+
+    def start(self, duration=None):
+        self.isRun = True
+        self.thread = threading.Thread(target=self.run, args=(duration,), daemon=True)
+        self.thread.start()
+        return self.port
+
+    def stop(self):
+        self.isRun = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def close(self):
+        self.stop()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def loadRecording(path, channels):
+    # the first channels sensor columns of a binary session log
+    from serial_common.sessionlog import readSession
+    header, records = readSession(path)
+    names = [name for name in records.dtype.names if name.startswith('Sensor') and not name.endswith('corrected')]
+    return [tuple(row) for row in records[names[:channels]].tolist()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Emulate a framed ToF / capacitive sensor board on a pty')
+    parser.add_argument('--channels', type=int, default=3)
+    parser.add_argument('--type', default='h', choices=['h', 'f'], help="'h' 2 byte integer, 'f' 4 byte float")
+    parser.add_argument('--rate', type=float, default=100.0, help='frames per second, 0 for as fast as possible')
+    parser.add_argument('--profile', default='tof', choices=['tof', 'capacitive'])
+    parser.add_argument('--recording', help='session log to stream instead of synthetic data')
+    parser.add_argument('--drop', type=float, default=0.0, help='probability of dropping a byte in a frame')
+    parser.add_argument('--stuck', type=int, nargs='*', default=[], help='channels that keep their first value')
+    parser.add_argument('--burst', type=int, default=0, help='extra frames sent back to back every second')
+    parser.add_argument('--seconds', type=float, help='stop after this many seconds')
+    args = parser.parse_args()
+
+    emulator = sensorEmulator(args.channels, args.type, args.rate, args.profile, args.drop, args.stuck,
+                              args.burst, args.recording)
+    print('Emulating ' + str(args.channels) + ' channels on ' + emulator.port)
+    emulator.isRun = True
+    try:
+        emulator.run(args.seconds)
+    except KeyboardInterrupt:
+        pass
+    print(str(emulator.sent) + ' frames, ' + str(emulator.bytesSent) + ' bytes sent, ' + str(emulator.dropped) +
+          ' frames corrupted, ' + str(emulator.overruns) + ' bytes overrun')
+    emulator.close()
+
+
+if __name__ == '__main__':
+    main()
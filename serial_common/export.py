@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# Columnar session export: the records of the session log written incrementally to compressed Parquet (or
+# Arrow IPC) with typed columns. Parquet keeps min / max statistics per row group and column, so a query like
+# "all the moments where sensor 2 < 50" reads only the row groups that can contain such samples.
+#
+#   python -m serial_common.export convert session_20240101_120000.bin session.parquet
+#   python -m serial_common.export query session.parquet --where "Sensor 2 < 50" --columns timestamp "Sensor 2"
+#
+# Like sessionLogger, the acquisition only queues the records and a background thread does the encoding.
+# A Parquet or Arrow file is readable once closed (its footer is written last).
+
+import argparse
+import collections
+import json
+import re
+import threading
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from serial_common.analysis import sessionFrames
+from serial_common.sessionlog import MAGIC, readSession
+
+OPERATORS = ('<=', '>=', '==', '!=', '<', '>')
+
+
+def exportFormat(path):
+    return 'arrow' if path.endswith(('.arrow', '.feather', '.ipc')) else 'parquet'
+
+
+class sessionExporter:
+    def __init__(self, path, columns, rowGroupSize=65536, compression='zstd', flushInterval=0.5, meta=None):
+        # columns: list of (name, numpy type) in record order, as for sessionLogger; .arrow / .feather paths give
+        # Arrow IPC, anything else Parquet
+        self.path = path
+        self.format = exportFormat(path)
+        self.dtype = np.dtype([(name, np.dtype(kind).newbyteorder('<')) for name, kind in columns])
+        self.rowGroupSize = rowGroupSize    # rows per row group (Parquet) or record batch (Arrow)
+        self.flushInterval = flushInterval
+        self.schema = pa.schema([pa.field(name, pa.from_numpy_dtype(self.dtype[name].newbyteorder('='))) for name in self.dtype.names],
+                                metadata={'serialplot': json.dumps({'created': time.time(), 'meta': meta or {}})})
+        if self.format == 'parquet':
+            self.writer = pq.ParquetWriter(path, self.schema, compression=compression, use_dictionary=False,
+                                           write_statistics=True)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+        self.pending = collections.deque()  # rows or record blocks waiting for the writer
+        self.buffered = []      # blocks not making a full row group yet
+        self.bufferedRows = 0
+        self.written = 0
+        self.rowGroups = 0
+        self.lock = threading.Lock()    # flush() may also be called by the producer, to keep the queue short
+        self.isRun = True
+        self.thread = threading.Thread(target=self.writerThread, daemon=True)
+        self.thread.start()
+
+    def append(self, row):
+        # one record as a tuple in column order
+        self.pending.append(row)
+
+    def appendBlock(self, records):
+        # many records at once, as a structured array of self.dtype
+        self.pending.append(records)
+
+    def queueDepth(self):
+        return len(self.pending)
+
+    def writerThread(self):
+        while self.isRun:
+            time.sleep(self.flushInterval)
+            self.flush()
+        self.flush(final=True)
+
+    def flush(self, final=False):
+        # full row groups only, unless final
+        with self.lock:
+            self.flushPending(final)
+
+    def flushPending(self, final):
+        rows = []
+        for i in range(len(self.pending)):
+            item = self.pending.popleft()
+            if isinstance(item, np.ndarray):
+                if rows:
+                    self.buffer(np.array(rows, self.dtype))
+                    rows = []
+                self.buffer(item.astype(self.dtype, copy=False))
+            else:
+                rows.append(item)
+        if rows:
+            self.buffer(np.array(rows, self.dtype))
+        if self.bufferedRows >= self.rowGroupSize or (final and self.bufferedRows):
+            records = np.concatenate(self.buffered)
+            full = len(records) if final else len(records) // self.rowGroupSize * self.rowGroupSize
+            for start in range(0, full, self.rowGroupSize):
+                self.write(records[start:start + self.rowGroupSize])
+            self.buffered = [records[full:]]
+            self.bufferedRows = len(records) - full
+
+    def buffer(self, records):
+        self.buffered.append(records)
+        self.bufferedRows += len(records)
+
+    def write(self, records):
+        arrays = [pa.array(np.ascontiguousarray(records[name]).astype(self.dtype[name].newbyteorder('='), copy=False))
+                  for name in self.dtype.names]
+        if self.format == 'parquet':
+            self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema), row_group_size=len(records))
+        else:
+            self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.written += len(records)
+        self.rowGroups += 1
+
+    def close(self):
+        self.isRun = False
+        self.thread.join()
+        self.writer.close()
+
+
+def parseCondition(text):
+    # 'Sensor 2 < 50' -> ('Sensor 2', '<', 50.0)
+    match = re.match(r'^\s*(.+?)\s*(' + '|'.join(re.escape(operator) for operator in OPERATORS) + r')\s*(\S+)\s*$', text)
+    if match is None:
+        raise ValueError('Condition not understood: ' + text + " (expected e.g. 'Sensor 2 < 50')")
+    name, operator, value = match.groups()
+    return name, operator, float(value)
+
+
+def querySession(path, conditions=(), columns=None):
+    # DataFrame of the rows matching all the (column, operator, value) conditions; with Parquet the row groups
+    # whose statistics exclude a match are not read
+    expression = pq.filters_to_expression([tuple(condition) for condition in conditions]) if conditions else None
+    dataset = ds.dataset(path, format='parquet' if exportFormat(path) == 'parquet' else 'ipc')
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def matchingRowGroups(path, conditions):
+    # (row groups that may match, row groups) of a Parquet file, from the min / max statistics alone
+    metadata = pq.ParquetFile(path).metadata
+    names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+    matching = 0
+    for group in range(metadata.num_row_groups):
+        rowGroup = metadata.row_group(group)
+        possible = True
+        for name, operator, value in conditions:
+            statistics = rowGroup.column(names.index(name)).statistics
+            if statistics is None or not statistics.has_min_max:
+                continue
+            low, high = statistics.min, statistics.max
+            possible &= {'<': low < value, '<=': low <= value, '>': high > value, '>=': high >= value,
+                         '==': low <= value <= high, '!=': not low == high == value}[operator]
+        matching += possible
+    return matching, metadata.num_row_groups
+
+
+def convert(source, destination, rowGroupSize=65536, compression='zstd', rate=None, chunkSize=1 << 20):
+    # a binary session log keeps its column types; text logs and raw captures get float64 values and sample
+    # times from rate
+    with open(source, 'rb') as file:
+        binary = file.read(len(MAGIC)) == MAGIC
+    if binary:
+        header, records = readSession(source)
+        exporter = sessionExporter(destination, [(name, records.dtype[name]) for name in records.dtype.names],
+                                   rowGroupSize, compression, meta=header['meta'])
+        for start in range(0, len(records), chunkSize):
+            exporter.appendBlock(np.array(records[start:start + chunkSize]))
+            exporter.flush()
+    else:
+        exporter = None
+        for times, frame, meta in sessionFrames(source, rate=rate, chunkSize=chunkSize):
+            if exporter is None:
+                exporter = sessionExporter(destination, [('timestamp', np.int64)] + [(name, np.float64) for name in frame.columns],
+                                           rowGroupSize, compression, meta={'source': source, 'rate': rate})
+            records = np.empty(len(frame), exporter.dtype)
+            records['timestamp'] = times
+            for name in frame.columns:
+                records[name] = frame[name].to_numpy()
+            exporter.appendBlock(records)
+            exporter.flush()
+        if exporter is None:
+            print('Empty recording')
+            return None
+    exporter.close()
+    return exporter
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Columnar export and queries of recorded sessions')
+    commands = parser.add_subparsers(dest='command', required=True)
+    converting = commands.add_parser('convert', help='session log, raw capture or value.log to Parquet / Arrow')
+    converting.add_argument('source')
+    converting.add_argument('destination', help='.parquet, or .arrow for Arrow IPC')
+    converting.add_argument('--compression', default='zstd', help='zstd, snappy, gzip, lz4 or none')
+    converting.add_argument('--row-group', type=int, default=65536, help='rows per row group')
+    converting.add_argument('--rate', type=float, help='sample rate of recordings without timestamps')
+    querying = commands.add_parser('query', help='rows matching conditions')
+    querying.add_argument('path')
+    querying.add_argument('--where', action='append', default=[], help="condition such as 'Sensor 2 < 50', repeatable")
+    querying.add_argument('--columns', nargs='+')
+    querying.add_argument('--csv', help='write the matching rows to this CSV file')
+    args = parser.parse_args()
+    if args.command == 'convert':
+        start = time.perf_counter()
+        exporter = convert(args.source, args.destination, args.row_group,
+                           None if args.compression == 'none' else args.compression, args.rate)
+        if exporter is not None:
+            print(str(exporter.written) + ' rows in ' + str(exporter.rowGroups) + ' row groups, ' + '%.2f' % (time.perf_counter() - start) + ' s')
+        return
+    conditions = [parseCondition(text) for text in args.where]
+    start = time.perf_counter()
+    rows = querySession(args.path, conditions, args.columns)
+    elapsed = time.perf_counter() - start
+    if exportFormat(args.path) == 'parquet' and conditions:
+        matching, total = matchingRowGroups(args.path, conditions)
+        print(str(matching) + ' of ' + str(total) + ' row groups read')
+    print(str(len(rows)) + ' matching rows in ' + '%.3f' % elapsed + ' s')
+    if args.csv:
+        rows.to_csv(args.csv, index=False)
+    else:
+        print(rows)
+
+
+if __name__ == '__main__':
+    main()
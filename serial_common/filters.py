@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# Streaming filters per channel, applied to blocks of samples (one row per sample, one column per channel)
+# between the acquisition and the detection. Every filter keeps its state across blocks, so the result
+# does not depend on how the samples were split into reads.
+#
+#   chain = parseFilters('gate:150:5, median:5, kalman:1:25', numChannels)
+#   filtered = chain.process(block)
+#
+# NaN samples (missing readings) do not move the filter state, the filters hold their last output instead.
+# The filters work on the whole block in NumPy: the linear ones (ema, kalman) as a closed-form recurrence,
+# the median over sliding windows, the gate copying the runs of rows it accepts anyway.
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+MIN_PRODUCT = 1e-8  # smallest running product of the decays in linearRecurrence, far from underflow
+
+
+def linearRecurrence(decay, drive, start):
+    # y[k] = decay[k] * y[k - 1] + drive[k] down the rows, y[-1] = start: in closed form with a cumulative product
+    # and sum, in pieces of rows short enough that the product of their decays stays above MIN_PRODUCT
+    result = np.empty(drive.shape)
+    smallest = decay.min() if decay.size else 1.0
+    if smallest <= 0:
+        step = 1
+    elif smallest < 1:
+        step = max(1, int(np.log(MIN_PRODUCT) / np.log(smallest)))
+    else:
+        step = len(drive) or 1
+    previous = start
+    for row in range(0, len(drive), step):
+        products = np.cumprod(decay[row:row + step], axis=0)
+        if step == 1:
+            result[row] = products[0] * previous + drive[row]
+        else:
+            result[row:row + step] = products * (previous + np.cumsum(drive[row:row + step] / products, axis=0))
+        previous = result[min(row + step, len(drive)) - 1]
+    return result
+
+
+def startFresh(block, present, start, decay, drive):
+    # channels without a state yet start at their first sample of the block, the rows before it stay NaN;
+    # returns the mask of those rows
+    fresh = np.isnan(start) & present.any(axis=0)
+    if not fresh.any():
+        return None
+    first = present.argmax(axis=0)
+    columns = np.flatnonzero(fresh)
+    start[columns] = block[first[columns], columns]
+    rows = np.arange(len(block))[:, None]
+    decay[fresh & (rows <= first)] = 1.0
+    drive[fresh & (rows <= first)] = 0.0
+    return fresh & (rows < first)
+
+
+class slidingMedian:
+    # median of the last window samples of every channel, all the windows of a block at once with
+    # sliding_window_view and np.median: O(window) per sample, in NumPy
+    def __init__(self, numChannels, window=5):
+        self.numChannels = numChannels
+        self.window = window
+        self.samples = [np.zeros(0) for i in range(numChannels)]   # last window samples, arrival order
+        self.output = np.full(numChannels, np.nan)
+
+    def process(self, block):
+        block = np.asarray(block, np.float64).reshape(-1, self.numChannels)
+        if len(block) and min(len(samples) for samples in self.samples) >= self.window - 1 and not np.isnan(block).any():
+            # every channel has a full window and every sample: all the channels at once
+            history = np.vstack((np.column_stack([samples[len(samples) - self.window + 1:] for samples in self.samples]), block))
+            result = np.median(sliding_window_view(history, self.window, axis=0), axis=-1)
+            self.samples = list(history[-self.window:].T.copy())
+            self.output = result[-1].copy()
+            return result
+        result = np.empty(block.shape)
+        for channel in range(self.numChannels):     # missing samples: every channel has its own windows
+            column = block[:, channel]
+            present = ~np.isnan(column)
+            values = column[present]
+            if not len(values):
+                result[:, channel] = self.output[channel]
+                continue
+            kept = len(self.samples[channel])
+            history = np.concatenate((self.samples[channel], values))
+            partial = max(0, min(self.window - 1, len(history)) - kept)    # new samples before the window is full
+            medians = np.empty(len(values))
+            for j in range(partial):
+                medians[j] = np.median(history[:kept + j + 1])
+            if len(values) > partial:
+                medians[partial:] = np.median(sliding_window_view(history[kept + partial - self.window + 1:], self.window), axis=1)
+            index = np.cumsum(present) - 1     # newest sample of every row, NaN rows hold the median
+            result[:, channel] = np.where(index >= 0, medians[np.maximum(index, 0)], self.output[channel])
+            self.samples[channel] = history[-self.window:].copy()
+            self.output[channel] = medians[-1]
+        return result
+
+
+class ema:
+    # exponential moving average, alpha is the weight of the new sample
+    def __init__(self, numChannels, alpha=0.2):
+        self.numChannels = numChannels
+        self.alpha = alpha
+        self.output = np.full(numChannels, np.nan)
+
+    def process(self, block):
+        block = np.asarray(block, np.float64).reshape(-1, self.numChannels)
+        present = ~np.isnan(block)
+        start = self.output.copy()
+        decay = np.where(present, 1 - self.alpha, 1.0)     # a NaN sample leaves the output as it is
+        drive = np.where(present, self.alpha * np.where(present, block, 0), 0.0)
+        before = startFresh(block, present, start, decay, drive)
+        result = linearRecurrence(decay, drive, start)
+        if before is not None:
+            result[before] = np.nan
+        if len(block):
+            self.output = result[-1].copy()
+        return result
+
+
+class kalman:
+    # 1-D Kalman filter of a random walk: processVariance is how much the distance may change between two
+    # samples, measurementVariance the sensor noise; the gain settles to a balance of the two
+    def __init__(self, numChannels, processVariance=1.0, measurementVariance=25.0):
+        self.numChannels = numChannels
+        self.processVariance = processVariance
+        self.measurementVariance = measurementVariance
+        self.estimate = np.full(numChannels, np.nan)
+        self.variance = np.full(numChannels, measurementVariance)
+        q, r = processVariance, measurementVariance
+        self.steadyVariance = (np.sqrt(q * q + 4 * q * r) - q) / 2   # fixed point of the variance update
+        self.steadyGain = (self.steadyVariance + q) / (self.steadyVariance + q + r)
+
+    def gains(self, present):
+        # gain of every row: the variance only depends on which samples are present, so once it has settled and
+        # the rest of the block has every sample, the gain is the steady one for all the remaining rows
+        gains = np.empty(present.shape)
+        incomplete = np.flatnonzero(~present.all(axis=1))
+        last = incomplete[-1] if len(incomplete) else -1
+        variance = self.variance
+        for i in range(len(present)):
+            if i > last and np.allclose(variance, self.steadyVariance, rtol=1e-12, atol=0):
+                gains[i:] = self.steadyGain
+                variance = np.full(self.numChannels, self.steadyVariance)
+                break
+            predicted = variance + self.processVariance
+            gain = predicted / (predicted + self.measurementVariance)
+            gains[i] = np.where(present[i], gain, 0.0)
+            variance = np.where(present[i], (1 - gain) * predicted, predicted)
+        self.variance = variance
+        return gains
+
+    def process(self, block):
+        block = np.asarray(block, np.float64).reshape(-1, self.numChannels)
+        present = ~np.isnan(block)
+        gains = self.gains(present)
+        start = self.estimate.copy()
+        decay = 1 - gains
+        drive = np.where(present, gains * np.where(present, block, 0), 0.0)
+        before = startFresh(block, present, start, decay, drive)
+        result = linearRecurrence(decay, drive, start)
+        if before is not None:
+            result[before] = np.nan
+        if len(block):
+            self.estimate = result[-1].copy()
+        return result
+
+
+class outlierGate:
+    # drops samples further than threshold from the last accepted one and holds that value instead;
+    # after maxHold rejected samples in a row the new level is accepted (a real step, not a spike)
+    def __init__(self, numChannels, threshold=100.0, maxHold=5):
+        self.numChannels = numChannels
+        self.threshold = threshold
+        self.maxHold = maxHold
+        self.accepted = np.full(numChannels, np.nan)
+        self.held = np.zeros(numChannels, np.int64)
+        self.rejected = np.zeros(numChannels, np.int64)    # samples dropped per channel
+
+    def process(self, block):
+        block = np.asarray(block, np.float64).reshape(-1, self.numChannels)
+        count = len(block)
+        result = np.empty(block.shape)
+        # rows within threshold of the previous row on every channel: after a row accepted everywhere they are
+        # all accepted, and copied in one go up to the next row that is not
+        smooth = np.zeros(count, bool)
+        smooth[1:] = (np.abs(np.diff(block, axis=0)) <= self.threshold).all(axis=1)   # NaN compares False
+        breaks = np.flatnonzero(~smooth)
+        accepted, held = self.accepted, self.held
+        i = 0
+        while i < count:
+            values = block[i]
+            outlier = np.abs(values - accepted) > self.threshold
+            keep = ~np.isnan(values) & (~outlier | (held >= self.maxHold) | np.isnan(accepted))
+            held = np.where(keep, 0, held + outlier)
+            self.rejected += outlier & ~keep
+            accepted = np.where(keep, values, accepted)
+            result[i] = accepted
+            i += 1
+            if keep.all():
+                following = np.searchsorted(breaks, i)
+                stop = breaks[following] if following < len(breaks) else count
+                if stop > i:
+                    result[i:stop] = block[i:stop]
+                    accepted = block[stop - 1].copy()
+                    i = stop
+        self.accepted, self.held = accepted, held
+        return result
+
+
+class filterChain:
+    def __init__(self, filters):
+        self.filters = list(filters)   # applied in order
+
+    def process(self, block):
+        # filtered block as float64, the same shape as the block
+        result = np.asarray(block, np.float64)
+        for stage in self.filters:
+            result = stage.process(result)
+        return result
+
+
+FILTERS = {'median': slidingMedian, 'ema': ema, 'kalman': kalman, 'gate': outlierGate}
+
+
+def parseFilters(text, numChannels):
+    # 'name[:parameter[:parameter]], ...' with the names of FILTERS and their parameters in order,
+    # e.g. 'gate:150:5, median:5, ema:0.3' or 'kalman:1:25'
+    filters = []
+    for item in text.split(','):
+        name, *parameters = item.strip().split(':')
+        parameters = [int(value) if value.strip().isdigit() else float(value) for value in parameters]
+        filters.append(FILTERS[name.strip()](numChannels, *parameters))
+    return filterChain(filters)
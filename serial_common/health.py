@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# Per-channel sensor health: stuck value, dropout, out of range and noise variance over a rolling window.
+# Every check is updated in O(1) per sample and vectorized across the channels.
+
+import numpy as np
+
+
+class healthMonitor:
+    def __init__(self, numChannels, window=15, low=None, high=None, dropoutValue=None, dropoutCount=3, maxVariance=None):
+        self.numChannels = numChannels
+        self.window = window                # same value this many times in a row means the sensor is stuck
+        self.low = low                      # valid range of the raw readings, None for no bound
+        self.high = high
+        self.dropoutValue = dropoutValue    # value the sensor sends when it has no reading (NaN always counts)
+        self.dropoutCount = dropoutCount    # consecutive dropouts before the channel is invalid
+        self.maxVariance = maxVariance      # rolling variance above this means the channel is too noisy
+        self.last = np.full(numChannels, np.nan)
+        self.runs = np.zeros(numChannels, np.int64)
+        self.dropoutRuns = np.zeros(numChannels, np.int64)
+        self.history = np.zeros((window, numChannels))  # rolling window for the variance
+        self.count = 0
+        self.mean = np.zeros(numChannels)
+        self.m2 = np.zeros(numChannels)     # Welford sum of squared differences over the window
+        self.stuck = np.zeros(numChannels, bool)
+        self.dropout = np.zeros(numChannels, bool)
+        self.outOfRange = np.zeros(numChannels, bool)
+        self.noisy = np.zeros(numChannels, bool)
+        self.valid = np.ones(numChannels, bool)
+        self.invalidCount = np.zeros(numChannels, np.int64)    # samples each channel was invalid
+
+    def update(self, values):
+        # add one sample of every channel and return the channel-valid mask
+        values = np.asarray(values, np.float64)
+        self.runs = np.where(values == self.last, self.runs + 1, 1)
+        self.last = values
+        self.stuck = self.runs >= self.window
+
+        missing = np.isnan(values)
+        if self.dropoutValue is not None:
+            missing |= values == self.dropoutValue
+        self.dropoutRuns = np.where(missing, self.dropoutRuns + 1, 0)
+        self.dropout = self.dropoutRuns >= self.dropoutCount
+
+        self.outOfRange = np.zeros(self.numChannels, bool)
+        if self.low is not None:
+            self.outOfRange |= values < self.low
+        if self.high is not None:
+            self.outOfRange |= values > self.high
+
+        if self.maxVariance is not None:
+            self.noisy = self.variance(np.where(missing, self.mean, values)) > self.maxVariance
+
+        self.valid = ~(self.stuck | self.dropout | self.outOfRange | self.noisy)
+        self.invalidCount += ~self.valid
+        return self.valid
+
+    def updateBlock(self, block):
+        # same result as update() on every row, vectorized over the block; returns the valid mask of every row
+        block = np.asarray(block, np.float64).reshape(-1, self.numChannels)
+        count = len(block)
+        if count == 0:
+            return np.zeros((0, self.numChannels), bool)
+        rows = np.arange(count)[:, None]
+        changed = block != np.vstack((self.last[None], block[:-1]))
+        lastChange = np.maximum.accumulate(np.where(changed, rows, -1), axis=0)
+        runs = np.where(lastChange >= 0, rows - lastChange + 1, self.runs + rows + 1)
+        stuck = runs >= self.window
+
+        missing = np.isnan(block)
+        if self.dropoutValue is not None:
+            missing |= block == self.dropoutValue
+        lastPresent = np.maximum.accumulate(np.where(missing, -1, rows), axis=0)
+        dropoutRuns = np.where(lastPresent >= 0, rows - lastPresent, self.dropoutRuns + rows + 1)
+        dropout = dropoutRuns >= self.dropoutCount
+
+        outOfRange = np.zeros(block.shape, bool)
+        if self.low is not None:
+            outOfRange |= block < self.low
+        if self.high is not None:
+            outOfRange |= block > self.high
+
+        noisy = np.zeros(block.shape, bool)
+        if self.maxVariance is not None:    # the rolling Welford update stays sequential
+            for i in range(count):
+                noisy[i] = self.variance(np.where(missing[i], self.mean, block[i])) > self.maxVariance
+
+        valid = ~(stuck | dropout | outOfRange | noisy)
+        self.invalidCount += (~valid).sum(axis=0)
+        self.last = block[-1]
+        self.runs = runs[-1]
+        self.dropoutRuns = dropoutRuns[-1]
+        self.stuck, self.dropout, self.outOfRange, self.noisy, self.valid = stuck[-1], dropout[-1], outOfRange[-1], noisy[-1], valid[-1]
+        return valid
+
+    def variance(self, values):
+        # rolling Welford update: the new sample replaces the one that leaves the window
+        slot = self.count % self.window
+        if self.count < self.window:
+            delta = values - self.mean
+            self.mean = self.mean + delta / (self.count + 1)
+            self.m2 = self.m2 + delta * (values - self.mean)
+        else:
+            old = self.history[slot]
+            mean = self.mean + (values - old) / self.window
+            self.m2 = np.maximum(self.m2 + (values - old) * (values - mean + old - self.mean), 0)
+            self.mean = mean
+        self.history[slot] = values
+        self.count += 1
+        samples = min(self.count, self.window)
+        if samples < 2:
+            return np.zeros(self.numChannels)
+        return self.m2 / (samples - 1)
+
+    def correct(self, values, replacement):
+        # replace the values of the invalid channels
+        return np.where(self.update(values), values, replacement)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# Heatmap rendering of many channels (taxel arrays, ToF matrices): one imshow for the current value of every
+# channel on its place in the grid, optionally a waterfall (one imshow row per frame, channels across) of the
+# recent history. Both are updated in place with set_data, so with blitAnimation the cost per frame stays
+# about the same from 6 to hundreds of channels, unlike one Line2D and one axes per channel.
+# The values are turned into RGBA bytes here with a lookup table of the fixed vmin..vmax, so matplotlib neither
+# normalises nor colour-maps the images on every frame; the waterfall maps only the rows added since the last one.
+
+import math
+
+import matplotlib
+import numpy as np
+
+
+def gridShape(count, rows=None):
+    # (rows, columns) of a grid for count cells, about square, taller than wide
+    rows = rows or math.ceil(math.sqrt(count))
+    return rows, math.ceil(count / rows)
+
+
+def gridPosition(index, rows):
+    # (row, column) of a cell, filled column by column
+    return index % rows, index // rows
+
+
+class colorTable:
+    # fixed vmin..vmax colour scale, values to RGBA bytes, NaN transparent; clipped like imshow does
+    def __init__(self, cmap='viridis', vmin=0, vmax=1000, levels=256):
+        self.cmap = matplotlib.colormaps[cmap] if isinstance(cmap, str) else cmap
+        self.vmin = vmin
+        self.vmax = vmax
+        self.levels = levels
+        self.scale = levels / (vmax - vmin)
+        self.table = np.vstack((self.cmap(np.linspace(0, 1, levels), bytes=True), np.zeros((1, 4), np.uint8)))
+
+    def rgba(self, values, out=None):
+        # (..., 4) uint8 colours of values, written into out if given
+        values = np.asarray(values, np.float64)
+        index = np.clip((values - self.vmin) * self.scale, 0, self.levels - 1)
+        index = np.where(np.isnan(values), self.levels, index).astype(np.intp)    # the last entry: transparent
+        return np.take(self.table, index, axis=0, out=out)
+
+
+class taxelHeatmap:
+    def __init__(self, ax, numChannels, shape=None, cells=None, vmin=0, vmax=1000, cmap='viridis', labels=False):
+        # shape: (rows, columns) of the grid, default gridShape; cells: flat grid index of every channel in
+        # row-major order (the physical layout of the pads), default gridPosition, the layout of the subplots
+        self.ax = ax
+        self.numChannels = numChannels
+        self.shape = shape or gridShape(numChannels)
+        if cells is None:
+            cells = [np.ravel_multi_index(gridPosition(i, self.shape[0]), self.shape) for i in range(numChannels)]
+        self.cells = np.asarray(cells)
+        self.grid = np.full(self.shape, np.nan)     # cells without a channel stay empty
+        self.colors = colorTable(cmap, vmin, vmax)
+        self.rgba = self.colors.rgba(self.grid)     # what the image shows, refilled in place
+        self.image = ax.imshow(self.rgba, vmin=vmin, vmax=vmax, cmap=cmap, interpolation='nearest')   # scale for a colorbar
+        ax.set_xticks([])
+        ax.set_yticks([])
+        self.texts = []
+        if labels:  # value of every taxel written on its cell, each text costs about 1 ms per frame
+            for channel, cell in enumerate(self.cells):
+                row, column = divmod(int(cell), self.shape[1])
+                self.texts.append(ax.text(column, row, '', ha='center', va='center', fontsize=8, color='w'))
+
+    def update(self, values):
+        self.grid.flat[self.cells] = values
+        self.colors.rgba(self.grid, self.rgba)
+        self.image.set_data(self.rgba)
+        for text, value in zip(self.texts, np.asarray(values).tolist()):
+            text.set_text('%.0f' % value)
+
+    def artists(self):
+        return [self.image] + self.texts
+
+
+class waterfall:
+    # the last length frames of every channel, newest row at the bottom
+    def __init__(self, ax, numChannels, length=200, vmin=0, vmax=1000, cmap='viridis'):
+        self.ax = ax
+        self.numChannels = numChannels
+        self.length = length
+        self.colors = colorTable(cmap, vmin, vmax)
+        self.buffer = np.zeros((2 * length, numChannels, 4), np.uint8)    # RGBA, every row stored twice: any window is one slice
+        self.head = 0
+        self.image = ax.imshow(self.buffer[:length], vmin=vmin, vmax=vmax, cmap=cmap, aspect='auto',
+                               interpolation='nearest')
+        ax.set_xlabel('Channel')
+        ax.set_ylabel('Frames ago')
+        ax.set_yticks([0, length - 1])
+        ax.set_yticklabels([str(length), '0'])
+
+    def update(self, block):
+        # append one frame or a block of frames (one row per frame)
+        block = np.asarray(block, np.float64).reshape(-1, self.numChannels)[-self.length:]
+        slots = (self.head + np.arange(len(block))) % self.length
+        colors = self.colors.rgba(block)
+        self.buffer[slots] = colors
+        self.buffer[slots + self.length] = colors
+        self.head += len(block)
+        start = self.head % self.length
+        self.image.set_data(self.buffer[start:start + self.length])    # a view, no copy of the history
+
+    def artists(self):
+        return [self.image]
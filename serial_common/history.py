@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# Multi-resolution history for long sessions: the raw samples of the last seconds, then tiers of min / max /
+# mean aggregates over 10x, 100x, ... samples going back hours. Every tier is a fixed size ring updated
+# incrementally as the blocks arrive, so memory stays bounded on multi-day runs, and a query over any time
+# range reads the finest tier that answers it with about as many rows as the plot has pixels.
+
+import numpy as np
+
+
+class historyTier:
+    # ring of (start time, min, max, sum, count) rows; the raw tier keeps only the values
+    def __init__(self, numChannels, capacity, factor=1):
+        self.numChannels = numChannels
+        self.capacity = capacity
+        self.factor = factor    # raw samples per row
+        self.times = np.zeros(capacity, np.int64)   # time of the first sample of every row, ns
+        self.head = 0
+        if factor == 1:
+            self.arrays = {'values': np.zeros((capacity, numChannels))}
+        else:
+            self.arrays = {'low': np.zeros((capacity, numChannels)), 'high': np.zeros((capacity, numChannels)),
+                           'sum': np.zeros((capacity, numChannels)), 'count': np.zeros((capacity, numChannels), np.int64)}
+        self.pending = None     # rows of the tier below not yet making a full row of this one
+
+    def write(self, times, columns):
+        count = len(times)
+        if count > self.capacity:
+            skipped = count - self.capacity
+            self.head += skipped
+            times, columns, count = times[skipped:], {key: value[skipped:] for key, value in columns.items()}, self.capacity
+        start = self.head % self.capacity
+        first = min(count, self.capacity - start)
+        for array, block in [(self.times, times)] + [(self.arrays[key], columns[key]) for key in self.arrays]:
+            array[start:start + first] = block[:first]
+            array[:count - first] = block[first:]
+        self.head += count
+
+    def oldest(self):
+        return max(0, self.head - self.capacity)
+
+    def find(self, time):
+        # position of the first row starting at or after time, without copying the ring
+        start, head = self.oldest(), self.head
+        if head == start:
+            return head
+        split = start % self.capacity
+        if split == 0:
+            segments = [(start, self.times[split:split + head - start])]
+        else:
+            segments = [(start, self.times[split:]), (start + self.capacity - split, self.times[:split])]
+        for offset, times in segments:
+            if len(times) and times[-1] >= time:
+                return offset + int(np.searchsorted(times, time))
+        return head
+
+    def rows(self, array, start, stop):
+        first, last = start % self.capacity, stop % self.capacity
+        if stop - start == 0:
+            return array[:0].copy()
+        if first < last:
+            return array[first:last].copy()
+        return np.concatenate((array[first:], array[:last]))
+
+    def read(self, start, stop):
+        # (times, low, high, mean) of the rows [start, stop)
+        times = self.rows(self.times, start, stop)
+        if self.factor == 1:
+            values = self.rows(self.arrays['values'], start, stop)
+            return times, values, values, values
+        count = self.rows(self.arrays['count'], start, stop)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.rows(self.arrays['sum'], start, stop) / count     # NaN where every sample was missing
+        return times, self.rows(self.arrays['low'], start, stop), self.rows(self.arrays['high'], start, stop), mean
+
+
+def aggregate(times, low, high, total, count, factor):
+    # groups of factor rows into one row each; returns the full groups and the rows left over
+    full = len(times) // factor * factor
+    shape = (-1, factor, low.shape[1])
+    rows = {'low': np.fmin.reduce(low[:full].reshape(shape), axis=1),    # fmin / fmax skip NaN
+            'high': np.fmax.reduce(high[:full].reshape(shape), axis=1),
+            'sum': total[:full].reshape(shape).sum(axis=1), 'count': count[:full].reshape(shape).sum(axis=1)}
+    rest = (times[full:], low[full:], high[full:], total[full:], count[full:])
+    return times[:full:factor], rows, rest
+
+
+class tieredHistory:
+    def __init__(self, numChannels, rawLength=65536, factors=(10, 100), tierLength=65536):
+        # factors: raw samples per row of every aggregated tier, each a multiple of the previous one
+        self.numChannels = numChannels
+        self.tiers = [historyTier(numChannels, rawLength)]
+        for factor in factors:
+            self.tiers.append(historyTier(numChannels, tierLength, factor))
+        self.samples = 0
+
+    def append(self, times, values):
+        # a block of samples (single writer): raw tier, then every aggregated tier from the one below
+        times = np.asarray(times, np.int64)
+        values = np.asarray(values, np.float64).reshape(-1, self.numChannels)
+        if len(times) == 0:
+            return
+        self.tiers[0].write(times, {'values': values})
+        self.samples += len(times)
+        missing = np.isnan(values)
+        rows = (times, values, values, np.where(missing, 0, values), (~missing).astype(np.int64))
+        below = self.tiers[0]
+        for tier in self.tiers[1:]:
+            if tier.pending is not None:
+                rows = tuple(np.concatenate((old, new)) for old, new in zip(tier.pending, rows))
+            starts, columns, tier.pending = aggregate(*rows, tier.factor // below.factor)
+            if len(starts) == 0:
+                break
+            tier.write(starts, columns)
+            rows = (starts, columns['low'], columns['high'], columns['sum'], columns['count'])
+            below = tier
+
+    def newest(self):
+        raw = self.tiers[0]
+        return int(raw.times[(raw.head - 1) % raw.capacity]) if raw.head else None
+
+    def query(self, start, stop, points=1000):
+        # (times, low, high, mean, tier index) between start and stop (ns): from the finest tier that still has
+        # the start and answers in at most about points rows, else the coarsest tier that has the start or has data
+        covering = []
+        for index, tier in enumerate(self.tiers):
+            if tier.head == 0:
+                break
+            if tier.head <= tier.capacity or tier.times[tier.oldest() % tier.capacity] <= start:
+                covering.append(index)
+                if tier.find(stop + 1) - tier.find(start) <= points:
+                    break
+        if not self.tiers[0].head:
+            empty = np.zeros((0, self.numChannels))
+            return np.zeros(0, np.int64), empty, empty, empty, 0
+        if covering:
+            index = covering[-1]
+        else:
+            index = max(i for i, tier in enumerate(self.tiers) if tier.head)
+        tier = self.tiers[index]
+        first = max(tier.oldest(), tier.find(start) - 1)    # one row earlier: the one the start falls in
+        return tier.read(first, tier.find(stop + 1)) + (index,)
+
+    def stats(self, seconds, now=None):
+        # min, max and mean of every channel over the last seconds, from as few rows as possible
+        now = self.newest() if now is None else now
+        if now is None:
+            return None
+        start = now - int(seconds * 1e9)
+        for index in range(len(self.tiers) - 1, -1, -1):   # coarsest tier first: fewest rows to combine
+            tier = self.tiers[index]
+            first, last = tier.find(start), tier.find(now + 1)
+            if last - first >= 64 or index == 0:    # enough rows that the partial ones at the ends hardly matter
+                times, low, high, mean = tier.read(first, last)
+                break
+        if len(times) == 0:
+            return None
+        if index == 0:
+            count = (~np.isnan(mean)).sum(axis=0)
+            total = np.nansum(mean, axis=0)
+        else:
+            count = tier.rows(tier.arrays['count'], first, last).sum(axis=0)
+            total = tier.rows(tier.arrays['sum'], first, last).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return {'low': np.fmin.reduce(low, axis=0), 'high': np.fmax.reduce(high, axis=0), 'mean': total / count,
+                    'samples': count, 'tier': index}
+
+    def memory(self):
+        # bytes held by all the tiers, fixed at construction
+        return sum(tier.times.nbytes + sum(array.nbytes for array in tier.arrays.values()) for tier in self.tiers)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# Runtime metrics of the acquisition: every metric is a function read only when somebody asks, so the hot
+# loops keep their plain counters and pay nothing. snapshot() returns the values as a dict, serve() exposes
+# them in the Prometheus text format on localhost:
+#
+#   curl http://127.0.0.1:9100/metrics
+
+import http.server
+import threading
+import time
+
+PREFIX = 'serialplot_'
+
+
+class metricsRegistry:
+    def __init__(self):
+        self.metrics = []   # (name, kind, help, function returning a number or {labels: number})
+        self.server = None
+        self.thread = None
+
+    def add(self, name, kind, help, function):
+        # kind 'counter' (only grows) or 'gauge'
+        self.metrics.append((name, kind, help, function))
+
+    def counter(self, name, help, function):
+        self.add(name, 'counter', help, function)
+
+    def gauge(self, name, help, function):
+        self.add(name, 'gauge', help, function)
+
+    def read(self, name, function, reader=None):
+        # reader: who asks, the rateMeters keep one window per reader
+        try:
+            if isinstance(function, rateMeter):
+                return function(reader)
+            return function()
+        except Exception as error:     # a metric must never take the endpoint down
+            print('Metric ' + name + ' failed: ' + repr(error))
+            return None
+
+    def snapshot(self, reader='snapshot'):
+        return {name: self.read(name, function, reader) for name, kind, help, function in self.metrics}
+
+    def prometheus(self, reader='scrape'):
+        lines = []
+        for name, kind, help, function in self.metrics:
+            value = self.read(name, function, reader)
+            lines.append('# HELP ' + PREFIX + name + ' ' + help)
+            lines.append('# TYPE ' + PREFIX + name + ' ' + kind)
+            if isinstance(value, dict):
+                for labels, number in value.items():
+                    label = ','.join(key + '="' + str(text).replace('"', '\\"') + '"' for key, text in labels)
+                    lines.append(PREFIX + name + '{' + label + '} ' + formatNumber(number))
+            elif value is not None:
+                lines.append(PREFIX + name + ' ' + formatNumber(value))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        registry = self
+
+        class handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.prometheus('scrape ' + self.client_address[0]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass    # no line on the console for every scrape
+
+        self.server = http.server.ThreadingHTTPServer((host, port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.server.server_address
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def formatNumber(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class rateMeter:
+    # events per second over the time since the previous reading by the same reader, for loop iteration
+    # counters: snapshot() and every scraper get their own window
+    def __init__(self, function):
+        self.function = function
+        self.start = (function(), time.perf_counter())
+        self.windows = {}   # reader: (count, time) of its previous reading
+        self.lock = threading.Lock()    # the endpoint serves every scrape in its own thread
+
+    def __call__(self, reader=None):
+        count = self.function()
+        now = time.perf_counter()
+        with self.lock:
+            last, then = self.windows.get(reader, self.start)
+            self.windows[reader] = (count, now)
+        return (count - last) / (now - then) if now > then else 0.0
+
+
+def watchParser(registry, parser):
+    registry.counter('bytes_read_total', 'Bytes read from the serial port', lambda: parser.bytesRead)
+    registry.counter('frames_total', 'Frames decoded', lambda: parser.frames)
+    registry.counter('checksum_errors_total', 'Frames rejected by the checksum', lambda: parser.checksumErrors)
+    registry.counter('resyncs_total', 'Times the parser had to look for the next sync header', lambda: parser.resyncs)
+    registry.counter('skipped_bytes_total', 'Bytes thrown away while resynchronizing', lambda: parser.skippedBytes)
+    registry.counter('seq_gaps_total', 'Frames missing according to the frame counter', lambda: parser.seqGaps)
+
+
+def watchRing(registry, ring, cursors=()):
+    registry.gauge('ring_fill', 'Samples written but not drained by the slowest consumer',
+                   lambda: max([cursor.pending() for cursor in cursors] or [0]))
+    registry.counter('samples_dropped_total', 'Samples overwritten before a consumer drained them', lambda: ring.overflows)
+    registry.counter('ring_backpressure_total', 'Drains that found a consumer past the high water mark',
+                     lambda: ring.backpressure)
+
+
+def watchLogger(registry, logger):
+    registry.gauge('logger_queue_depth', 'Rows and blocks waiting for the log writer', logger.queueDepth)
+    registry.counter('logger_records_total', 'Records written to the session log', lambda: logger.written)
+
+
+def watchDetector(registry, detector):
+    registry.counter('zone_transitions_total', 'Zone changes of the detector, by new zone',
+                     lambda: {(('zone', label),): count for label, count in list(detector.counts.items())})
+    registry.gauge('zone', 'Current zone index, 0 the closest', lambda: -1 if detector.zone is None else detector.zone)
+
+
+def watchClock(registry, clock):
+    registry.gauge('sample_rate_hz', 'Effective sample rate', clock.rate)
+    registry.gauge('sample_jitter_seconds', 'Standard deviation of the sample inter-arrival time',
+                   lambda: clock.jitter() / 1e9)
+    registry.counter('sample_gaps_total', 'Inter-arrival intervals longer than the gap factor', lambda: clock.gaps)
+
+
+def watchAnimation(registry, animation):
+    registry.gauge('render_seconds', 'Average render time of one plot frame', lambda: animation.renderMs / 1000)
+    registry.gauge('plot_fps', 'Plot frames per second', lambda: animation.fps)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# Concurrent acquisition of several sensor boards (e.g. the ToF array and the capacitive skin) in one thread:
+# a selector waits on all the ports at once, every frame gets its arrival time and goes to the ring of its port.
+# alignedReader fuses the ports on the timeline of a reference port, with the nearest sample or linear
+# interpolation of the others. Windows has no select() on serial ports, there the ports are polled.
+#
+#   python -m serial_common.multiport tof=/dev/ttyUSB0:3:h skin=/dev/ttyUSB1:1:f --method linear
+
+import argparse
+import os
+import selectors
+import threading
+import time
+
+import numpy as np
+import serial
+
+from serial_common.protocol import frameParser
+from serial_common.ring import sampleRing
+from serial_common.schema import frameSchema
+
+
+class serialSource:
+    def __init__(self, name, device, channels, dataType='h', baud=115200, capacity=65536):
+        self.name = name
+        self.device = device
+        self.connection = serial.Serial(device, baud, timeout=0)    # reads return what is already there
+        self.schema = channels if isinstance(channels, frameSchema) else frameSchema.uniform(channels, dataType)   # or a mixed layout
+        self.channels = len(self.schema.fields)
+        self.parser = frameParser(self.schema.size)
+        self.ring = sampleRing(self.channels, capacity)
+        self.isOpen = True
+
+    def poll(self):
+        # read everything waiting, timestamp it and append the decoded frames to the ring; returns the frame count
+        chunk = self.connection.read(self.connection.in_waiting or 1)
+        if not chunk:
+            return 0
+        arrival = time.perf_counter_ns()    # one arrival time per read, the frames of a chunk came together
+        frames = self.parser.feed(chunk)
+        if frames:
+            values = self.schema.array([payload for seq, payload in frames])
+            self.ring.write([seq for seq, payload in frames], values, arrival)
+        return len(frames)
+
+    def close(self):
+        self.isOpen = False
+        self.connection.close()
+
+
+class multiPortReader:
+    def __init__(self, sources, pollInterval=0.001):
+        self.sources = list(sources)
+        self.pollInterval = pollInterval    # sleep of the polling fallback when no port had data
+        self.arrived = threading.Condition()    # notified after every pass that read some frames
+        self.useSelector = os.name != 'nt'
+        self.isRun = False
+        self.thread = None
+
+    def start(self):
+        self.isRun = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        selector = None
+        if self.useSelector:
+            selector = selectors.DefaultSelector()
+            for source in self.sources:
+                selector.register(source.connection.fileno(), selectors.EVENT_READ, source)
+        while self.isRun and any(source.isOpen for source in self.sources):
+            if selector is not None:
+                ready = [key.data for key, mask in selector.select(0.1)]
+            else:
+                ready = [source for source in self.sources if source.isOpen]
+            received = 0
+            for source in ready:
+                try:
+                    received += source.poll()
+                except (serial.SerialException, OSError) as error:
+                    print('Lost ' + source.name + ' (' + source.device + '): ' + str(error))
+                    if selector is not None:
+                        selector.unregister(source.connection.fileno())
+                    source.close()
+            if received:
+                with self.arrived:
+                    self.arrived.notify_all()
+            elif selector is None:
+                time.sleep(self.pollInterval)
+        if selector is not None:
+            selector.close()
+
+    def reader(self, reference=0, method='nearest'):
+        return alignedReader(self, reference, method)
+
+    def snapshot(self, at=None, method='nearest', history=64):
+        # values of every port at time at (perf_counter_ns), by default the newest time all the ports have reached
+        latest = []
+        for source in self.sources:
+            ring = source.ring
+            head = ring.head
+            start = max(0, head - min(history, ring.capacity))
+            latest.append((ring.rows(ring.timestamps, start, head), ring.rows(ring.values, start, head)))
+        if any(len(times) == 0 for times, values in latest):
+            return None, None
+        if at is None:
+            at = min(times[-1] for times, values in latest)
+        at = np.array([at], np.int64)
+        return int(at[0]), np.hstack([alignValues(at, times, values, method) for times, values in latest])[0]
+
+    def stats(self):
+        return {source.name: {'frames': source.parser.frames, 'checksum_errors': source.parser.checksumErrors,
+                              'seq_gaps': source.parser.seqGaps, 'overflows': source.ring.overflows}
+                for source in self.sources}
+
+    def stop(self):
+        self.isRun = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def close(self):
+        self.stop()
+        for source in self.sources:
+            if source.isOpen:
+                source.close()
+
+
+def alignValues(times, sourceTimes, sourceValues, method='nearest'):
+    # values of a port at the given times: the closest sample, or linear interpolation between the two around it
+    after = np.searchsorted(sourceTimes, times)     # first sample at or after every time
+    last = len(sourceTimes) - 1
+    before = np.clip(after - 1, 0, last)
+    after = np.clip(after, 0, last)
+    tBefore = sourceTimes[before]
+    tAfter = sourceTimes[after]
+    if method == 'nearest':
+        return sourceValues[np.where(tAfter - times < times - tBefore, after, before)]
+    span = tAfter - tBefore
+    weight = np.clip((times - tBefore) / np.where(span > 0, span, 1), 0, 1)[:, None]
+    weight[span == 0] = 1
+    return sourceValues[before] + weight * (sourceValues[after] - sourceValues[before])
+
+
+class alignedReader:
+    # drains the ports together: one fused row per sample of the reference port, once every live port has caught
+    # up; a port that is closed or silent for staleAfter seconds stops holding the others back and gets NaN
+    def __init__(self, acquisition, reference=0, method='nearest', staleAfter=0.5, maxRows=65536):
+        self.acquisition = acquisition
+        self.reference = reference
+        self.method = method    # 'nearest' or 'linear'
+        self.staleAfter = int(staleAfter * 1e9)
+        self.maxRows = maxRows  # rows buffered per port at most, the oldest are dropped beyond
+        self.cursors = [source.ring.reader() for source in acquisition.sources]
+        self.chunks = [[] for source in acquisition.sources]    # (times, values) drained, not fused yet
+        self.dropped = 0
+
+    def pending(self):
+        return sum(cursor.pending() for cursor in self.cursors)
+
+    def wait(self, timeout=None):
+        with self.acquisition.arrived:
+            return self.acquisition.arrived.wait_for(lambda: self.pending() > 0, timeout)
+
+    def buffered(self, i):
+        # (times, values) of port i as single arrays, merging the chunks once
+        chunks = self.chunks[i]
+        if len(chunks) != 1:
+            source = self.acquisition.sources[i]
+            times = np.concatenate([times for times, values in chunks]) if chunks else np.zeros(0, np.int64)
+            values = np.concatenate([values for times, values in chunks]) if chunks else np.zeros((0, source.channels))
+            if len(times) > self.maxRows:
+                self.dropped += len(times) - self.maxRows
+                times, values = times[-self.maxRows:], values[-self.maxRows:]
+            self.chunks[i] = [(times, values)]
+        return self.chunks[i][0]
+
+    def drain(self):
+        # returns (timestamps, values) with the channels of all the ports side by side, in port order
+        for i, cursor in enumerate(self.cursors):
+            seqs, timestamps, values = cursor.drain()
+            if len(timestamps):
+                self.chunks[i].append((timestamps, values))
+        buffers = [self.buffered(i) for i in range(len(self.cursors))]
+        referenceTimes, referenceValues = buffers[self.reference]
+        width = sum(source.channels for source in self.acquisition.sources)
+        if len(referenceTimes) == 0:
+            return np.zeros(0, np.int64), np.zeros((0, width))
+        now = time.perf_counter_ns()
+        live = [i for i, (source, (times, values)) in enumerate(zip(self.acquisition.sources, buffers))
+                if i != self.reference and source.isOpen and
+                (len(times) and now - times[-1] <= self.staleAfter or not len(times) and now - referenceTimes[0] <= self.staleAfter)]
+        if any(not len(buffers[i][0]) for i in live):
+            return np.zeros(0, np.int64), np.zeros((0, width))     # a live port has not sent anything yet
+        horizon = min([buffers[i][0][-1] for i in live] or [referenceTimes[-1]])
+        count = np.searchsorted(referenceTimes, horizon, 'right')   # reference samples every live port has passed
+        times = referenceTimes[:count]
+        columns = []
+        for i, (portTimes, portValues) in enumerate(buffers):
+            if i == self.reference:
+                columns.append(referenceValues[:count])
+            elif not len(portTimes):
+                columns.append(np.full((count, portValues.shape[1]), np.nan))
+            else:
+                aligned = alignValues(times, portTimes, portValues, self.method).astype(np.float64)
+                if i not in live:
+                    aligned[times > portTimes[-1]] = np.nan     # nothing newer from this port
+                columns.append(aligned)
+        if count:
+            for i, (portTimes, portValues) in enumerate(buffers):   # keep only what the next rows can still need
+                keep = count if i == self.reference else max(0, np.searchsorted(portTimes, times[-1]) - 1)
+                self.chunks[i] = [(portTimes[keep:], portValues[keep:])]
+        return times, np.hstack(columns)
+
+
+def parseSource(text):
+    # name=device:channels[:type[:baud]]
+    name, spec = text.split('=', 1)
+    parts = spec.split(':')
+    return serialSource(name, parts[0], int(parts[1]), parts[2] if len(parts) > 2 else 'h',
+                        int(parts[3]) if len(parts) > 3 else 115200)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Acquire several sensor boards at once and print the fused samples')
+    parser.add_argument('sources', nargs='+', help='name=device:channels[:type[:baud]], the first is the time reference')
+    parser.add_argument('--method', default='nearest', choices=['nearest', 'linear'])
+    parser.add_argument('--seconds', type=float, help='stop after this many seconds')
+    args = parser.parse_args()
+
+    acquisition = multiPortReader([parseSource(text) for text in args.sources])
+    reader = acquisition.reader(0, args.method)
+    acquisition.start()
+    start = time.perf_counter()
+    nextPrint = start + 1
+    rows = 0
+    try:
+        while args.seconds is None or time.perf_counter() - start < args.seconds:
+            if reader.wait(0.5):
+                times, values = reader.drain()
+                rows += len(times)
+                if len(times) and time.perf_counter() >= nextPrint:
+                    nextPrint += 1
+                    print(str(rows) + ' fused samples, last: ' + str(np.round(values[-1], 1).tolist()))
+    except KeyboardInterrupt:
+        pass
+    acquisition.close()
+    for name, counters in acquisition.stats().items():
+        print(name + ': ' + ', '.join(key + ' ' + str(value) for key, value in counters.items()))
+
+
+if __name__ == '__main__':
+    main()
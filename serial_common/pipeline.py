@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# Processing of one ToF sample, shared by the live scripts and the replay tool:
+# clamp to the sensor max output, channel health check, optional streaming filters (serial_common.filters),
+# correction of the invalid channels, min distance and, when a zoneDetector is attached, the detection on the
+# corrected min distance.
+
+import numpy as np
+
+from serial_common.health import healthMonitor
+
+
+class tofPipeline:
+    def __init__(self, numChannels, limit, window=15, low=None, high=None, dropoutValue=None, maxVariance=None,
+                 detector=None, filters=None):
+        self.numChannels = numChannels
+        self.limit = limit
+        self.detector = detector
+        self.filters = filters  # filterChain run on the clamped values, before the invalid channels are replaced
+        self.health = healthMonitor(numChannels, window, low, high, dropoutValue, maxVariance=maxVariance)
+
+    def process(self, values, seq=None, arrival=None):
+        # returns (clamped values, corrected values, min of the clamped values, min of the corrected values)
+        value_array = [min(value, self.limit) for value in values]
+        valid = self.health.update(values)  # stuck, dropped out, out of range or too noisy channels
+        filtered = value_array if self.filters is None else self.filters.process(value_array)[0].tolist()
+        corrected = [value if ok else self.limit for value, ok in zip(filtered, valid)]
+        min_value = min(corrected)
+        if self.detector is not None:
+            self.detector.update(min_value, seq, arrival)
+        return value_array, corrected, min(value_array), min_value
+
+
+    def processBlock(self, block, seqs=None, arrivals=None):
+        # process() for every row of a block, with the health check vectorized over the block;
+        # returns (clamped, corrected, min clamped, min corrected) as arrays with one row per sample,
+        # corrected being also filtered
+        block = np.asarray(block).reshape(-1, self.numChannels)
+        valid = self.health.updateBlock(block)
+        clamped = np.minimum(block, self.limit)
+        filtered = clamped if self.filters is None else self.filters.process(clamped)
+        corrected = np.where(valid, filtered, self.limit)
+        min_values = corrected.min(axis=1)
+        if self.detector is not None:
+            count = len(block)
+            seqs = [None] * count if seqs is None else seqs
+            arrivals = np.broadcast_to(arrivals, (count,)).tolist() if arrivals is not None else [None] * count
+            for min_value, seq, arrival in zip(min_values.tolist(), seqs, arrivals):
+                self.detector.update(min_value, seq, arrival)
+        return clamped, corrected, clamped.min(axis=1), min_values
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# Framed serial protocol used between the sensor boards and serialPlot
+#
+#   | 0xAA 0x55 | length | seq | payload (length bytes) | checksum lo | checksum hi |
+#   | 0xAA 0x55 | 0xFF | length lo | length hi | seq | payload | checksum lo | checksum hi |    (255 bytes and more)
+#
+# length   number of payload bytes (numPlots * dataNumBytes for the ToF boards); a length byte of 0xFF announces
+#          a 16 bit length, so large arrays (64 float taxels, 128 channels) fit while short frames keep their format
+# seq      frame counter, incremented by the firmware for every frame and wrapping at 256
+# checksum (length + seq + sum of the payload bytes) & 0xFFFF, little endian
+#
+# Firmware side (Arduino):
+#   Serial.write(0xAA); Serial.write(0x55); Serial.write(len); Serial.write(seq++);
+#   Serial.write(payload, len); Serial.write(sum & 0xFF); Serial.write(sum >> 8);
+#   (for len >= 255: Serial.write(0xFF); Serial.write(len & 0xFF); Serial.write(len >> 8); in place of the length)
+
+import struct
+
+SYNC = b'\xaa\x55'
+HEADER_SIZE = 4     # sync (2) + length (1) + seq (1)
+EXTENDED = 0xFF     # length byte of the frames with a 16 bit length, 2 more header bytes
+MAX_PAYLOAD = 0xFFFF
+CHECKSUM_SIZE = 2
+MAX_BUFFER = 1 << 17    # never keep more than this many unparsed bytes around (two of the largest frames)
+
+
+def checksum(length, seq, payload):
+    return (length + seq + sum(payload)) & 0xFFFF
+
+
+def encodeFrame(seq, payload):
+    seq &= 0xFF
+    length = len(payload)
+    if length > MAX_PAYLOAD:
+        raise ValueError('Payload of ' + str(length) + ' bytes, a frame carries at most ' + str(MAX_PAYLOAD))
+    header = bytes((length, seq)) if length < EXTENDED else struct.pack('<BHB', EXTENDED, length, seq)
+    return SYNC + header + bytes(payload) + struct.pack('<H', checksum(length, seq, payload))
+
+
+def readChunk(serialConnection):
+    # a single read for everything already waiting in the OS buffer, or block (up to the port timeout) for one byte
+    return serialConnection.read(serialConnection.in_waiting or 1)
+
+
+class frameParser:
+    def __init__(self, payloadLength=None):
+        self.payloadLength = payloadLength  # expected payload size, None accepts any length
+        self.buffer = bytearray()
+        self.lastSeq = None
+        self.bytesRead = 0
+        self.frames = 0
+        self.checksumErrors = 0
+        self.resyncs = 0        # times we had to hunt for the next sync header
+        self.skippedBytes = 0   # bytes thrown away while resynchronizing
+        self.seqGaps = 0        # frames missing according to the sequence counter
+
+    def feed(self, chunk):
+        # append a chunk of bytes and return every complete frame in it as a list of (seq, payload)
+        buf = self.buffer
+        buf += chunk
+        self.bytesRead += len(chunk)
+        frames = []
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            start = buf.find(SYNC, pos)
+            if start < 0:
+                keep = 1 if buf[end - 1] == SYNC[0] else 0   # could be the first half of the next header
+                self.skip(end - keep - pos)
+                pos = end - keep
+                break
+            if start != pos:
+                self.skip(start - pos)
+                pos = start
+            if end - start < HEADER_SIZE:
+                break
+            length = buf[start + 2]
+            headerSize = HEADER_SIZE
+            if length == EXTENDED:
+                headerSize += 2
+                if end - start < headerSize:
+                    break
+                length = buf[start + 3] | (buf[start + 4] << 8)
+            if self.payloadLength is not None and length != self.payloadLength:
+                self.skippedBytes += 1  # not a real header, look for the next one
+                pos = start + 1
+                continue
+            frameEnd = start + headerSize + length + CHECKSUM_SIZE
+            if frameEnd > end:
+                break   # wait for the rest of the frame
+            seq = buf[start + headerSize - 1]
+            payload = bytes(buf[start + headerSize:frameEnd - CHECKSUM_SIZE])
+            if checksum(length, seq, payload) != buf[frameEnd - 2] | (buf[frameEnd - 1] << 8):
+                self.checksumErrors += 1
+                self.skippedBytes += 1  # resync inside the corrupted frame
+                pos = start + 1
+                continue
+            if self.lastSeq is not None:
+                self.seqGaps += (seq - self.lastSeq - 1) & 0xFF
+            self.lastSeq = seq
+            self.frames += 1
+            frames.append((seq, payload))
+            pos = frameEnd
+        del buf[:pos]
+        if len(buf) > MAX_BUFFER:   # garbage that never turns into a frame
+            self.skip(len(buf))
+            del buf[:]
+        return frames
+
+    def skip(self, count):
+        if count > 0:
+            self.resyncs += 1
+            self.skippedBytes += count
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# Local fan-out of the decoded samples: the process that owns the serial port publishes timestamped blocks
+# as datagrams on a Unix socket path or a localhost UDP port, any number of subscribers (plotter, logger,
+# robot controller) receive them without opening the port or decoding again.
+#
+#   publisher = samplePublisher(('127.0.0.1', 5600))      # or samplePublisher('/tmp/serialplot.sock')
+#   publisher.publish(times, counters, values)             # from the reader thread, never blocks
+#
+#   for times, counters, values in sampleSubscriber(('127.0.0.1', 5600)):
+#       ...
+#
+# Subscribers register with a datagram and repeat it every second, so they survive a restart of the
+# publisher; one that stays silent for a few seconds is dropped. Every datagram is one batch:
+#
+#   | b'SPUB' | version | type char | channels uint16 | rows uint16 | batch uint64 | session uint64 |
+#   | rows x timestamp int64 ns | rows x device counter int64 | rows x channels values of the type |
+#
+# session is a random number of every publisher instance, a new one tells the subscribers it restarted.
+
+import argparse
+import os
+import select
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b'SPUB'
+VERSION = 2
+HEADER = struct.Struct('<4sBcHHQQ')
+SUBSCRIBE = b'SUB'
+UNSUBSCRIBE = b'BYE'
+MAX_DATAGRAM = 60000    # under the UDP limit, also fine for Unix datagram sockets
+HEARTBEAT = 1.0         # seconds between two subscriptions of a subscriber
+EXPIRY = 5.0            # subscribers silent this long are dropped
+
+
+def openSocket(address):
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    return socket.socket(family, socket.SOCK_DGRAM)
+
+
+def encodeBatch(batch, times, counters, values, session=0):
+    values = np.ascontiguousarray(values)
+    rows, channels = values.shape
+    header = HEADER.pack(MAGIC, VERSION, values.dtype.char.encode(), channels, rows, batch, session)
+    return b''.join((header, np.asarray(times, '<i8').tobytes(), np.asarray(counters, '<i8').tobytes(),
+                     values.astype(values.dtype.newbyteorder('<'), copy=False).tobytes()))
+
+
+def decodeBatch(data):
+    # (session, batch, times, counters, values) of a datagram, None if it is not one of ours
+    if len(data) < HEADER.size:
+        return None
+    magic, version, kind, channels, rows, batch, session = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        return None
+    dtype = np.dtype(kind.decode()).newbyteorder('<')
+    if len(data) != HEADER.size + rows * (16 + channels * dtype.itemsize):
+        return None
+    times = np.frombuffer(data, '<i8', rows, HEADER.size)
+    counters = np.frombuffer(data, '<i8', rows, HEADER.size + rows * 8)
+    values = np.frombuffer(data, dtype, rows * channels, HEADER.size + rows * 16).reshape(rows, channels)
+    return session, batch, times, counters, values
+
+
+class samplePublisher:
+    def __init__(self, address, batchSize=256, maxDelay=0.02):
+        self.address = address  # Unix socket path or (host, port), meant for localhost
+        self.batchSize = batchSize  # rows collected before a datagram is sent
+        self.maxDelay = maxDelay    # seconds a row may wait for the batch to fill
+        self.socket = openSocket(address)
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)  # left over by a previous run
+        self.socket.bind(address)
+        self.socket.setblocking(False)     # a full subscriber must never block the reader thread
+        self.subscribers = {}   # address: last subscription time
+        self.lock = threading.Lock()
+        self.pending = []       # (times, counters, values) blocks not sent yet
+        self.pendingRows = 0
+        self.oldest = None
+        self.batch = 0          # batches sent, the gap detection of the subscribers
+        self.session = struct.unpack('<Q', os.urandom(8))[0]   # this instance, a restart gets another one
+        self.sent = 0           # datagrams, counting every subscriber
+        self.dropped = 0        # datagrams a subscriber had no room for
+        self.isRun = True
+        self.thread = threading.Thread(target=self.controlThread, daemon=True)
+        self.thread.start()
+
+    def publish(self, times, counters, values):
+        # queue a block of samples, sends as soon as batchSize rows are waiting
+        values = np.asarray(values).reshape(len(times), -1)
+        with self.lock:
+            self.pending.append((np.asarray(times), np.asarray(counters), values))
+            self.pendingRows += len(values)
+            if self.oldest is None:
+                self.oldest = time.perf_counter()
+            if self.pendingRows >= self.batchSize:
+                self.flush()
+
+    def flush(self):
+        # called with the lock held
+        if not self.pending:
+            return
+        times, counters, values = (np.concatenate(column) for column in zip(*self.pending))
+        self.pending = []
+        self.pendingRows = 0
+        self.oldest = None
+        rows = max(1, (MAX_DATAGRAM - HEADER.size) // (16 + values.shape[1] * values.dtype.itemsize))
+        for start in range(0, len(values), rows):
+            data = encodeBatch(self.batch, times[start:start + rows], counters[start:start + rows],
+                               values[start:start + rows], self.session)
+            self.batch += 1
+            for address in list(self.subscribers):
+                try:
+                    self.socket.sendto(data, address)
+                    self.sent += 1
+                except (BlockingIOError, InterruptedError):
+                    self.dropped += 1   # the subscriber is behind, it sees the batch gap
+                except OSError:
+                    self.subscribers.pop(address, None)     # gone
+
+    def controlThread(self):
+        # subscriptions, expiry of the silent subscribers and the maxDelay flush
+        while self.isRun:
+            try:
+                readable = select.select([self.socket], [], [], min(self.maxDelay, 0.1))[0]
+                if readable:
+                    message, address = self.socket.recvfrom(64)
+                    with self.lock:
+                        if message == SUBSCRIBE:
+                            self.subscribers[address] = time.perf_counter()
+                        elif message == UNSUBSCRIBE:
+                            self.subscribers.pop(address, None)
+            except (BlockingIOError, ConnectionRefusedError, ConnectionResetError):
+                pass    # UDP reports here that an old subscriber port is closed (reset on Windows)
+            except OSError:
+                if not self.isRun:
+                    break   # socket closed by close()
+                # any other socket error is transient for a datagram socket, the publisher keeps serving
+            except ValueError:
+                if not self.isRun:
+                    break
+                raise
+            now = time.perf_counter()
+            with self.lock:
+                for address, seen in list(self.subscribers.items()):
+                    if now - seen > EXPIRY:
+                        del self.subscribers[address]
+                if self.oldest is not None and now - self.oldest >= self.maxDelay:
+                    self.flush()
+
+    def close(self):
+        self.isRun = False
+        self.thread.join()
+        with self.lock:
+            self.flush()
+        self.socket.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+class sampleSubscriber:
+    def __init__(self, address, timeout=1.0):
+        self.address = address
+        self.timeout = timeout
+        self.socket = openSocket(address)
+        self.path = None
+        if isinstance(address, str):    # a Unix datagram socket needs its own path to get answers
+            self.path = os.path.join(tempfile.gettempdir(), 'serialplot-%d-%d.sock' % (os.getpid(), id(self)))
+            self.socket.bind(self.path)
+        else:
+            self.socket.bind(('127.0.0.1', 0))
+        self.socket.settimeout(min(timeout, HEARTBEAT))
+        self.lastSubscribe = 0.0
+        self.session = None     # of the publisher of the last batch
+        self.lastBatch = None
+        self.lastCounter = None
+        self.batches = 0
+        self.lostBatches = 0    # datagrams missing according to the batch number
+        self.lostSamples = 0    # samples missing according to the device counter
+        self.reconnects = 0     # times the publisher restarted (new session)
+        self.gapCallbacks = []
+
+    def onGap(self, callback):
+        # callback(lostBatches, lostSamples) called for every gap found
+        self.gapCallbacks.append(callback)
+
+    def subscribe(self):
+        try:
+            self.socket.sendto(SUBSCRIBE, self.address)
+        except OSError:
+            pass    # publisher not running (yet), the next heartbeat tries again
+        self.lastSubscribe = time.perf_counter()
+
+    def receive(self, timeout=None):
+        # next (times, counters, values) block, None if nothing arrived within timeout seconds
+        deadline = time.perf_counter() + (self.timeout if timeout is None else timeout)
+        while True:
+            now = time.perf_counter()
+            if now - self.lastSubscribe >= HEARTBEAT:
+                self.subscribe()
+            if now >= deadline:
+                return None
+            self.socket.settimeout(max(0.001, min(deadline - now, HEARTBEAT - (now - self.lastSubscribe))))
+            try:
+                data = self.socket.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                time.sleep(min(0.1, max(0.0, deadline - time.perf_counter())))
+                continue
+            decoded = decodeBatch(data)
+            if decoded is None:
+                continue
+            session, batch, times, counters, values = decoded
+            self.checkGaps(session, batch, counters)
+            return times, counters, values
+
+    def checkGaps(self, session, batch, counters):
+        lostBatches = lostSamples = 0
+        if self.session is not None and session != self.session:
+            self.reconnects += 1    # publisher restarted: its batch numbers and the device counters start over
+            self.lastBatch = self.lastCounter = None
+        self.session = session
+        if self.lastBatch is not None:
+            lostBatches = max(0, batch - self.lastBatch - 1)
+        if self.lastCounter is not None and len(counters):
+            lostSamples = max(0, int(counters[0]) - self.lastCounter - 1)
+        if len(counters):
+            lostSamples += int(np.maximum(np.diff(counters) - 1, 0).sum())
+            self.lastCounter = int(counters[-1])
+        self.lastBatch = batch
+        self.batches += 1
+        self.lostBatches += lostBatches
+        self.lostSamples += lostSamples
+        if lostBatches or lostSamples:
+            for callback in self.gapCallbacks:
+                callback(lostBatches, lostSamples)
+
+    def __iter__(self):
+        while True:
+            block = self.receive()
+            if block is not None:
+                yield block
+
+    def close(self):
+        try:
+            self.socket.sendto(UNSUBSCRIBE, self.address)
+        except OSError:
+            pass
+        self.socket.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def parseAddress(text):
+    # host:port for UDP, anything else is a Unix socket path
+    host, separator, port = text.rpartition(':')
+    if separator and port.isdigit():
+        return host or '127.0.0.1', int(port)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Subscribe to the samples published by serialPlot and report rate and gaps')
+    parser.add_argument('address', help='host:port or Unix socket path of the publisher')
+    args = parser.parse_args()
+    subscriber = sampleSubscriber(parseAddress(args.address))
+    subscriber.onGap(lambda batches, samples: print('gap: ' + str(batches) + ' batches, ' + str(samples) + ' samples'))
+    samples = 0
+    start = time.perf_counter()
+    try:
+        for times, counters, values in subscriber:
+            samples += len(values)
+            now = time.perf_counter()
+            if now - start >= 1:
+                print('%.0f samples/s, last %s' % (samples / (now - start), values[-1].tolist()))
+                samples = 0
+                start = now
+    except KeyboardInterrupt:
+        pass
+    subscriber.close()
+
+
+if __name__ == '__main__':
+    main()
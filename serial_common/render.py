@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# One animation driver per figure: a single timer calls update(), then only the animated artists are redrawn
+# on top of the cached figure background (blitting). Frame rate and costs are measured on every frame.
+
+import time
+
+
+class blitAnimation:
+    def __init__(self, fig, update, artists, interval=50, statsText=None):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.update = update            # called once per frame, updates the data of the artists
+        self.artists = list(artists)
+        self.statsText = statsText      # optional text artist showing the measured rates
+        if statsText is not None and statsText not in self.artists:
+            self.artists.append(statsText)
+        for artist in self.artists:
+            artist.set_animated(True)   # left out of the full redraws, so they are not part of the background
+        self.background = None
+        self.previous = None
+        self.frames = 0
+        self.fps = 0.0          # running averages
+        self.updateMs = 0.0
+        self.renderMs = 0.0
+        self.canvas.mpl_connect('draw_event', self.onDraw)
+        self.canvas.mpl_connect('close_event', self.onClose)
+        self.timer = self.canvas.new_timer(interval=interval)
+        self.timer.add_callback(self.step)
+        self.timer.start()
+
+    def onDraw(self, event):
+        # full redraw (first show, resize, zoom): cache the new background and put the artists back on it
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.drawArtists()
+
+    def onClose(self, event):
+        self.timer.stop()
+
+    def drawArtists(self):
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+
+    def step(self):
+        start = time.perf_counter()
+        if self.previous is not None:
+            self.fps = average(self.fps, 1 / max(start - self.previous, 1e-6), self.frames)
+        self.previous = start
+        self.update()
+        updated = time.perf_counter()
+        if self.statsText is not None:
+            self.statsText.set_text('%.1f fps  update %.2f ms  render %.2f ms' % (self.fps, self.updateMs, self.renderMs))
+        if self.background is None or not getattr(self.canvas, 'supports_blit', True):
+            self.canvas.draw_idle()     # no background yet, the draw event will cache it
+        else:
+            self.canvas.restore_region(self.background)
+            self.drawArtists()
+            self.canvas.blit(self.fig.bbox)
+            self.canvas.flush_events()
+        end = time.perf_counter()
+        self.updateMs = average(self.updateMs, (updated - start) * 1000, self.frames)
+        self.renderMs = average(self.renderMs, (end - updated) * 1000, self.frames)
+        self.frames += 1
+
+
+def average(mean, value, count, alpha=0.1):
+    # exponential moving average, plain mean for the first samples
+    if count < 1 / alpha:
+        return mean + (value - mean) / (count + 1)
+    return mean + alpha * (value - mean)
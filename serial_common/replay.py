@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# Replay a recorded session through the same pipeline as Tof_sensor_3 (decode, health check, correction,
+# detection), at the original timing or as fast as possible, to tune the thresholds on real recordings.
+#
+#   python -m serial_common.replay session_20240101_120000.bin --speed 0 --limit 800 --zones 60 150 300
+#
+# Accepts binary session logs, raw captures of the framed serial stream and the old text value.log.
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+from serial_common.detection import zoneDetector
+from serial_common.filters import parseFilters
+from serial_common.pipeline import tofPipeline
+from serial_common.protocol import SYNC, frameParser
+from serial_common.schema import frameSchema
+from serial_common.sessionlog import MAGIC, readSession
+
+CHUNK = 65536   # samples (or bytes for raw captures) read at a time
+
+
+def sessionBlocks(path, channels=None):
+    # (timestamps ns, seqs, values) blocks of a binary session log
+    header, records = readSession(path)
+    names = [name for name in records.dtype.names if name.startswith('Sensor') and not name.endswith('corrected')]
+    names = names[:channels]
+    for start in range(0, len(records), CHUNK):
+        chunk = records[start:start + CHUNK]
+        values = np.stack([chunk[name] for name in names], axis=1)
+        seqs = chunk['seq'].tolist() if 'seq' in chunk.dtype.names else None
+        yield chunk['timestamp'].astype(np.int64), seqs, values
+
+
+def captureBlocks(path, dataType='h', rate=None):
+    # decode a raw capture of the serial stream (framed as in serial_common.protocol)
+    parser = frameParser()
+    size = np.dtype(dataType).itemsize
+    schema = None
+    count = 0
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(CHUNK)
+            if not chunk:
+                break
+            frames = parser.feed(chunk)
+            if not frames:
+                continue
+            if schema is None:     # the first frame gives the layout, any other length is noise from then on
+                schema = frameSchema.uniform(len(frames[0][1]) // size, dataType)
+                parser.payloadLength = schema.size
+                frames = [frame for frame in frames if len(frame[1]) == schema.size]
+            values = schema.array([payload for seq, payload in frames])
+            yield sampleTimes(count, len(frames), rate), [seq for seq, payload in frames], values
+            count += len(frames)
+
+
+def readText(path, chunkSize=CHUNK):
+    # DataFrames of a text value.log, chunkSize rows at a time with the C parser of pandas; the header line of
+    # Tof_sensor_3 ('Sensor 1', 'Sensor 2', ...) names the columns, logs without one get Sensor 1, Sensor 2, ...
+    with open(path) as file:
+        first = file.readline()
+    header = 0 if any(character.isalpha() for character in first) else None
+    frames = pd.read_csv(path, engine='c', header=header, chunksize=chunkSize, skipinitialspace=True, quotechar="'",
+                         dtype=np.float64, on_bad_lines='skip')
+    for frame in frames:
+        if header is None:
+            frame.columns = ['Sensor ' + str(i + 1) for i in range(frame.shape[1])]
+        yield frame
+
+
+def textBlocks(path, channels=3, rate=None):
+    # the text value.log of Tof_sensor_3: a header line, then the sensor values separated by commas
+    count = 0
+    for frame in readText(path):
+        values = frame.iloc[:, :channels].dropna().to_numpy().astype(np.int64)
+        if len(values):
+            yield sampleTimes(count, len(values), rate), None, values
+            count += len(values)
+
+
+def sampleTimes(first, count, rate):
+    # timestamps of recordings that have none: from --rate, else one second per sample
+    return (np.arange(first, first + count) * (1e9 / (rate or 1))).astype(np.int64)
+
+
+def recordingKind(path):
+    with open(path, 'rb') as file:
+        start = file.read(len(MAGIC))
+    if start == MAGIC:
+        return 'session'
+    if start.startswith(SYNC):
+        return 'capture'
+    return 'text'
+
+
+def openBlocks(path, channels=None, dataType='h', rate=None):
+    kind = recordingKind(path)
+    if kind == 'session':
+        return sessionBlocks(path, channels)
+    if kind == 'capture':
+        return captureBlocks(path, dataType, rate)
+    return textBlocks(path, channels or 3, rate)
+
+
+class sessionReplay:
+    def __init__(self, pipeline, speed=0.0):
+        self.pipeline = pipeline
+        self.speed = speed      # 1 original timing, 2 twice as fast, 0 as fast as the CPU allows
+        self.events = []        # zoneEvents, with the recording time (ns) as arrival
+        self.samples = 0
+        self.elapsed = 0.0
+        self.first = None
+        self.last = None
+        pipeline.detector.subscribe(self.events.append)
+
+    def run(self, blocks):
+        start = time.perf_counter()
+        for timestamps, seqs, values in blocks:
+            if self.first is None:
+                self.first = int(timestamps[0])
+            if self.speed:  # original timing: one sample at a time, waiting for its turn
+                for i in range(len(values)):
+                    delay = (timestamps[i] - self.first) / 1e9 / self.speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+                    self.process(values[i:i + 1], None if seqs is None else seqs[i:i + 1], timestamps[i:i + 1])
+            else:
+                self.process(values, seqs, timestamps)
+            self.last = int(timestamps[-1])
+        self.elapsed = time.perf_counter() - start
+        return self
+
+    def process(self, values, seqs, timestamps):
+        self.pipeline.processBlock(values, seqs, timestamps)    # the recording time becomes the event arrival
+        self.samples += len(values)
+
+    def dwell(self):
+        # seconds spent in every zone, from the transitions
+        dwell = {}
+        for event, following in zip(self.events, self.events[1:] + [None]):
+            end = self.last if following is None else following.arrival
+            dwell[event.label] = dwell.get(event.label, 0) + (end - event.arrival) / 1e9
+        return dwell
+
+    def report(self):
+        duration = (self.last - self.first) / 1e9 if self.samples else 0.0
+        rate = self.samples / self.elapsed if self.elapsed else 0.0
+        lines = [str(self.samples) + ' samples in ' + '%.3f' % self.elapsed + ' s = ' + '%.0f' % rate + ' samples/s',
+                 'recording ' + '%.1f' % duration + ' s, replayed ' +
+                 '%.1fx' % (duration / self.elapsed if self.elapsed else 0.0) + ' real time',
+                 str(len(self.events)) + ' zone transitions',
+                 'zone dwell [s]: ' + ', '.join(str(label) + ' ' + '%.2f' % seconds for label, seconds in self.dwell().items()),
+                 'invalid samples per channel: ' + str(self.pipeline.health.invalidCount.tolist())]
+        return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded session through the detection pipeline')
+    parser.add_argument('path')
+    parser.add_argument('--speed', type=float, default=0.0, help='1 for the original timing, 0 for as fast as possible')
+    parser.add_argument('--channels', type=int, help='number of sensors (default: all in the recording, 3 for text logs)')
+    parser.add_argument('--type', default='h', choices=['h', 'f'], help='data type of raw captures')
+    parser.add_argument('--rate', type=float, help='sample rate of recordings without timestamps')
+    parser.add_argument('--limit', type=float, help='sensor max output (default: from the session, else 1000)')
+    parser.add_argument('--array-dimension', type=int, help='samples in a row that mean a stuck sensor')
+    parser.add_argument('--range', type=float, nargs=2, help='valid raw range')
+    parser.add_argument('--dropout-value', type=float, help='value sent without a reading (default: from the session)')
+    parser.add_argument('--max-variance', type=float, help='rolling variance that marks a noisy channel (default: from the session)')
+    parser.add_argument('--zones', type=float, nargs='+', help='zone borders, closest first')
+    parser.add_argument('--hysteresis', type=float)
+    parser.add_argument('--filters', help="streaming filters, e.g. 'gate:150:5, median:5' (default: from the session)")
+    parser.add_argument('--events', action='store_true', help='print every zone transition')
+    args = parser.parse_args()
+
+    meta = {}
+    if recordingKind(args.path) == 'session':
+        meta = readSession(args.path)[0]['meta']
+    blocks = openBlocks(args.path, args.channels, args.type, args.rate)
+    first = next(blocks, None)
+    if first is None:
+        print('Empty recording')
+        return
+
+    def option(value, key, default):
+        return value if value is not None else meta.get(key, default)
+
+    detector = zoneDetector(option(args.zones, 'zones', (50, 150, 300)), hysteresis=option(args.hysteresis, 'hysteresis', 10))
+    low, high = option(args.range, 'range', (0, 8191))
+    filters = option(args.filters, 'filters', None)
+    pipeline = tofPipeline(first[2].shape[1], option(args.limit, 'limit', 1000), option(args.array_dimension, 'array_dimension', 15),
+                           low, high, option(args.dropout_value, 'dropout_value', None),
+                           option(args.max_variance, 'max_variance', None), detector=detector, filters=parseFilters(filters, first[2].shape[1]) if filters else None)
+    replay = sessionReplay(pipeline, args.speed)
+    replay.run(itertools.chain([first], blocks))
+    if args.events:
+        for event in replay.events:
+            print('%10.3f  %-16s %s' % ((event.arrival - replay.first) / 1e9, event.label, event.distance))
+    print(replay.report())
+
+
+if __name__ == '__main__':
+    main()
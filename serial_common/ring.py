@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# Lossless sample capture: the reader thread appends every decoded frame with its arrival time,
+# each consumer keeps its own cursor and drains everything written since its last drain.
+# The writer claims the rows it is about to fill (reserved) before it writes them and publishes them (head)
+# after: a reader that copied or used rows checks reserved to know whether the writer has reached them since.
+
+import threading
+
+import numpy as np
+
+
+class sampleRing:
+    def __init__(self, numChannels, capacity=65536, dataType=np.float64, highWater=0.75):
+        self.numChannels = numChannels
+        self.capacity = capacity
+        self.values = np.zeros((capacity, numChannels), dataType)
+        self.timestamps = np.zeros(capacity, np.int64)   # perf_counter_ns at arrival
+        self.seqs = np.zeros(capacity, np.int32)         # frame counter sent by the board
+        self.head = 0           # samples written so far, only the writer moves it
+        self.reserved = 0       # head plus the samples being written: rows below reserved - capacity are overwritten
+        self.highWater = int(capacity * highWater)
+        self.overflows = 0      # samples overwritten before some consumer drained them
+        self.backpressure = 0   # drains that found a consumer more than highWater samples behind
+        self.arrived = threading.Condition()    # notified after every write
+
+    def write(self, seqs, values, timestamps):
+        # append a block of samples (single writer); the block becomes visible only once head moves
+        values = np.asarray(values).reshape(-1, self.numChannels)
+        count = len(values)
+        seqs = np.broadcast_to(seqs, (count,))
+        timestamps = np.broadcast_to(timestamps, (count,))     # one arrival time per sample or per chunk
+        self.reserved = self.head + count   # claimed before any row is touched
+        if count > self.capacity:   # only the newest capacity samples can be kept anyway
+            skipped = count - self.capacity     # consumers account them as overflows when they drain
+            self.head += skipped
+            seqs, values, timestamps, count = seqs[skipped:], values[skipped:], timestamps[skipped:], self.capacity
+        start = self.head % self.capacity
+        first = min(count, self.capacity - start)
+        for array, block in ((self.seqs, seqs), (self.values, values), (self.timestamps, timestamps)):
+            array[start:start + first] = block[:first]
+            array[:count - first] = block[first:]
+        self.head += count
+        with self.arrived:
+            self.arrived.notify_all()
+
+    def reader(self):
+        return ringCursor(self)
+
+    def rows(self, array, start, stop):
+        # copy of the samples [start, stop) of one of the arrays, unwrapping the ring
+        first, last = start % self.capacity, stop % self.capacity
+        if stop - start == 0:
+            return array[:0].copy()
+        if first < last:
+            return array[first:last].copy()
+        return np.concatenate((array[first:], array[:last]))
+
+    def view(self, start, stop):
+        # zero-copy (seqs, timestamps, values) of the samples [start, stop), only up to the wrap point;
+        # valid as long as lapped(start) is False
+        first = start % self.capacity
+        count = min(stop - start, self.capacity - first)
+        return self.seqs[first:first + count], self.timestamps[first:first + count], self.values[first:first + count]
+
+    def lapped(self, start):
+        # True once the writer has claimed the slot of sample start for a newer one
+        return self.reserved - self.capacity > start
+
+
+class ringCursor:
+    def __init__(self, ring):
+        self.ring = ring
+        self.position = ring.head   # start with the next sample written
+        self.overflows = 0
+        self.backpressure = 0
+
+    def pending(self):
+        return self.ring.head - self.position
+
+    def wait(self, timeout=None):
+        # block until new samples arrive or the timeout expires, True if there is something to drain
+        with self.ring.arrived:
+            return self.ring.arrived.wait_for(lambda: self.pending() > 0, timeout)
+
+    def drain(self):
+        # return (seqs, timestamps, values) of every sample written since the last drain
+        ring = self.ring
+        head = ring.head
+        start = self.position
+        if head - start > ring.capacity:
+            self.lost(head - start - ring.capacity)
+            start = head - ring.capacity
+        if head - start > ring.highWater:
+            self.backpressure += 1
+            ring.backpressure += 1
+        seqs = ring.rows(ring.seqs, start, head)
+        timestamps = ring.rows(ring.timestamps, start, head)
+        values = ring.rows(ring.values, start, head)
+        torn = ring.reserved - ring.capacity - start    # oldest rows the writer claimed while we were copying
+        if torn > 0:
+            self.lost(torn)
+            seqs, timestamps, values = seqs[torn:], timestamps[torn:], values[torn:]
+        self.position = head
+        return seqs, timestamps, values
+
+    def view(self):
+        # zero-copy (seqs, timestamps, values) of the pending samples up to the wrap point, None when the cursor
+        # is past the high water mark (drain() copies them then); release() them once they are used
+        ring = self.ring
+        head = ring.head
+        if head - self.position > ring.highWater:
+            return None
+        return ring.view(self.position, head)
+
+    def release(self, count):
+        # done with the count samples of the last view: False if the writer reached some of them meanwhile,
+        # they are counted as lost then
+        torn = min(count, self.ring.reserved - self.ring.capacity - self.position)
+        self.position += count
+        if torn > 0:
+            self.lost(torn)
+            return False
+        return True
+
+    def lost(self, count):
+        self.overflows += count
+        self.ring.overflows += count
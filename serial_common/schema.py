@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# Declarative frame layout: name, struct type character, scale and offset (value = raw * scale + offset)
+# and byte order of every field of the payload. Compiled once into a NumPy structured dtype, so a whole
+# chunk of frames is decoded with one np.frombuffer instead of a struct.unpack per value, and frames can
+# mix types (int16 ToF distances next to float32 capacitive values).
+#
+#   schema = frameSchema.parse('tof1:h, tof2:h, tof3:h, skin:f*0.5')
+#   values = schema.array([payload for seq, payload in frames])     # (frames, fields)
+
+import collections
+import struct
+
+import numpy as np
+from numpy.lib import recfunctions
+
+frameField = collections.namedtuple('frameField', 'name type scale offset byteorder')
+frameField.__new__.__defaults__ = (1.0, 0.0, None)
+
+
+class frameSchema:
+    def __init__(self, fields, byteorder='<'):
+        # fields: frameFields or tuples (name, type[, scale[, offset[, byteorder]]])
+        self.fields = [field if isinstance(field, frameField) else frameField(*field) for field in fields]
+        self.byteorder = byteorder      # of the fields that do not give their own
+        self.dtype = np.dtype([(field.name, (field.byteorder or byteorder) + field.type) for field in self.fields])
+        self.size = self.dtype.itemsize
+        self.names = [field.name for field in self.fields]
+        self.scales = np.array([field.scale for field in self.fields], np.float64)
+        self.offsets = np.array([field.offset for field in self.fields], np.float64)
+        self.scaled = bool(np.any(self.scales != 1) or np.any(self.offsets != 0))
+        types = set(self.dtype[name] for name in self.names)
+        self.plain = types.pop() if len(types) == 1 else None   # one type for all: decoded as a plain 2D array
+        self.struct = None  # per frame decoder, only when every field has the same byte order
+        orders = set(field.byteorder or byteorder for field in self.fields)
+        if len(orders) == 1:
+            self.struct = struct.Struct(orders.pop() + ''.join(field.type for field in self.fields))
+        if self.struct is not None and self.struct.size != self.size:
+            raise ValueError('frame schema with padding: ' + str(self.dtype))
+
+    @classmethod
+    def uniform(cls, count, dataType='h', prefix='Sensor ', byteorder='<'):
+        # the layout of the scripts: count values of the same type, named Sensor 1..count
+        return cls([(prefix + str(i + 1), dataType) for i in range(count)], byteorder)
+
+    @classmethod
+    def parse(cls, text, byteorder='<'):
+        # 'name:type[*scale][+offset], ...', the type may start with < or > for its own byte order
+        fields = []
+        for item in text.split(','):
+            name, spec = item.strip().split(':')
+            offset = 0.0
+            if '+' in spec:
+                spec, offset = spec.split('+')
+            scale = 1.0
+            if '*' in spec:
+                spec, scale = spec.split('*')
+            order = None
+            if spec[0] in '<>':
+                order, spec = spec[0], spec[1:]
+            fields.append(frameField(name.strip(), spec.strip(), float(scale), float(offset), order))
+        return cls(fields, byteorder)
+
+    def records(self, payloads):
+        # structured array with one record per payload, raw values
+        if not payloads:
+            return np.zeros(0, self.dtype)
+        return np.frombuffer(b''.join(payloads), self.dtype)
+
+    def array(self, payloads, dtype=None):
+        # (frames, fields) array of the values; scaled schemas give float64
+        if self.plain is not None:
+            values = np.frombuffer(b''.join(payloads), self.plain).reshape(-1, len(self.fields))
+            values = values.astype(dtype or self.plain.newbyteorder('='))
+        else:
+            values = recfunctions.structured_to_unstructured(self.records(payloads), dtype)
+        if self.scaled:
+            values = values * self.scales + self.offsets
+        return values
+
+    def unpack(self, payload):
+        # values of a single frame
+        if self.struct is None:
+            return tuple(self.array([payload])[0].tolist())
+        values = self.struct.unpack(payload)
+        if self.scaled:
+            values = tuple(value * scale + offset for value, scale, offset in zip(values, self.scales, self.offsets))
+        return values
+
+    def pack(self, values):
+        # payload of one frame from the scaled values (emulators, tests)
+        record = np.zeros(1, self.dtype)
+        for field, value in zip(self.fields, values):
+            raw = (value - field.offset) / field.scale
+            record[field.name] = raw if self.dtype[field.name].kind == 'f' else round(raw)
+        return record.tobytes()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Binary session log: a small JSON header describing the columns, then fixed width little endian records.
+# The acquisition only queues the rows, a background thread writes them in batches every flushInterval.
+# readSession() maps the records back as a NumPy structured array without loading the file.
+#
+#   | b'SPLOG001' | header length (uint32) | JSON header, space padded to 64 bytes | records ... |
+
+import collections
+import json
+import struct
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b'SPLOG001'
+ALIGN = 64
+
+
+class sessionLogger:
+    def __init__(self, path, columns, flushInterval=0.5, meta=None):
+        # columns: list of (name, numpy type) in record order
+        self.path = path
+        self.dtype = np.dtype([(name, np.dtype(kind).newbyteorder('<')) for name, kind in columns])
+        self.flushInterval = flushInterval
+        self.pending = collections.deque()  # rows or record blocks waiting for the writer
+        self.written = 0
+        self.file = open(path, 'wb')
+        header = {'columns': [[name, self.dtype[name].str] for name in self.dtype.names],
+                  'record_size': self.dtype.itemsize, 'created': time.time(), 'meta': meta or {}}
+        text = json.dumps(header).encode()
+        size = len(MAGIC) + 4 + len(text)
+        text += b' ' * (-size % ALIGN)
+        self.file.write(MAGIC + struct.pack('<I', len(text)) + text)
+        self.file.flush()
+        self.isRun = True
+        self.thread = threading.Thread(target=self.writerThread, daemon=True)
+        self.thread.start()
+
+    def append(self, row):
+        # one record as a tuple in column order
+        self.pending.append(row)
+
+    def appendBlock(self, records):
+        # many records at once, as a structured array of self.dtype
+        self.pending.append(records)
+
+    def queueDepth(self):
+        return len(self.pending)
+
+    def writerThread(self):
+        while self.isRun:
+            time.sleep(self.flushInterval)
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        rows = []
+        blocks = []
+        for i in range(len(self.pending)):
+            item = self.pending.popleft()
+            if isinstance(item, np.ndarray):
+                if rows:
+                    blocks.append(np.array(rows, self.dtype))
+                    rows = []
+                blocks.append(item.astype(self.dtype, copy=False))
+            else:
+                rows.append(item)
+        if rows:
+            blocks.append(np.array(rows, self.dtype))
+        for block in blocks:
+            self.file.write(block.tobytes())
+            self.written += len(block)
+        if blocks:
+            self.file.flush()
+
+    def close(self):
+        self.isRun = False
+        self.thread.join()
+        self.file.close()
+
+
+def readHeader(path):
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(str(path) + ' is not a session log')
+        length, = struct.unpack('<I', file.read(4))
+        header = json.loads(file.read(length))
+    header['offset'] = len(MAGIC) + 4 + length
+    header['dtype'] = np.dtype([(name, kind) for name, kind in header['columns']])
+    return header
+
+
+def readSession(path):
+    # returns (header, records) with the records memory mapped; a record cut by a crash is ignored
+    header = readHeader(path)
+    dtype = header['dtype']
+    with open(path, 'rb') as file:
+        file.seek(0, 2)
+        count = (file.tell() - header['offset']) // dtype.itemsize
+    if count == 0:
+        return header, np.zeros(0, dtype)
+    return header, np.memmap(path, dtype, 'r', header['offset'], (count,))
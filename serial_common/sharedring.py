@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# sampleRing in multiprocessing.shared_memory, so the acquisition can run in its own process (own GIL) and
+# the GUI, logger and detection processes read it from the same memory, as copies (drain) or views (view).
+#
+#   | header: int64 slots (head, capacity, channels, type, stop, counters ...) | timestamps | seqs | values |
+#
+# The single writer claims the rows in reserved, copies them and then publishes them with one aligned int64 store
+# to head; readers check reserved after copying (or using a view) to drop the rows the writer reached meanwhile,
+# in flight or done (as ringCursor does).
+# The counter slots carry the statistics of the writer process (parser, clock) to the readers.
+
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from serial_common.ring import ringCursor, sampleRing
+
+FIELDS = ['head', 'capacity', 'channels', 'type', 'stop', 'bytes_read', 'frames', 'checksum_errors', 'resyncs',
+          'skipped_bytes', 'seq_gaps', 'reader_loops', 'rate_mhz', 'jitter_ns', 'gaps', 'lost_frames', 'pid', 'reserved']
+RESERVED = FIELDS.index('reserved')
+HEADER_SIZE = 256   # bytes, room for more slots and keeps the arrays 64 byte aligned
+
+
+class sharedRing(sampleRing):
+    def __init__(self, name=None, numChannels=None, capacity=65536, dataType=np.float64, highWater=0.75, create=False):
+        # create=True allocates a new block (the writer), else attaches to the block called name
+        if create:
+            dataType = np.dtype(dataType)
+            size = HEADER_SIZE + capacity * 16 + capacity * numChannels * dataType.itemsize
+            self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+            self.header = np.ndarray(len(FIELDS), np.int64, self.memory.buf)
+            self.header[:] = 0
+            self.header[FIELDS.index('capacity')] = capacity
+            self.header[FIELDS.index('channels')] = numChannels
+            self.header[FIELDS.index('type')] = ord(dataType.char)
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+            self.header = np.ndarray(len(FIELDS), np.int64, self.memory.buf)
+            capacity = int(self.header[FIELDS.index('capacity')])
+            numChannels = int(self.header[FIELDS.index('channels')])
+            dataType = np.dtype(chr(self.header[FIELDS.index('type')]))
+        self.name = self.memory.name
+        self.owner = create
+        self.numChannels = numChannels
+        self.capacity = capacity
+        buffer = self.memory.buf
+        self.timestamps = np.ndarray(capacity, np.int64, buffer, HEADER_SIZE)
+        self.seqs = np.ndarray(capacity, np.int64, buffer, HEADER_SIZE + capacity * 8)
+        self.values = np.ndarray((capacity, numChannels), dataType, buffer, HEADER_SIZE + capacity * 16)
+        self.highWater = int(capacity * highWater)
+        self.overflows = 0      # of the cursors of this process
+        self.backpressure = 0
+        self.arrived = None     # no condition across processes, the cursors poll head
+
+    @property
+    def head(self):
+        return int(self.header[0])
+
+    @head.setter
+    def head(self, value):
+        self.header[0] = value  # one aligned store: the rows before it are visible to the readers
+
+    @property
+    def reserved(self):
+        return int(self.header[RESERVED])
+
+    @reserved.setter
+    def reserved(self, value):
+        self.header[RESERVED] = value
+
+    def write(self, seqs, values, timestamps):
+        # same as sampleRing.write, without the notification
+        values = np.asarray(values).reshape(-1, self.numChannels)
+        count = len(values)
+        seqs = np.broadcast_to(seqs, (count,))
+        timestamps = np.broadcast_to(timestamps, (count,))
+        self.reserved = self.head + count
+        if count > self.capacity:
+            skipped = count - self.capacity
+            self.head += skipped
+            seqs, values, timestamps, count = seqs[skipped:], values[skipped:], timestamps[skipped:], self.capacity
+        head = self.head
+        start = head % self.capacity
+        first = min(count, self.capacity - start)
+        for array, block in ((self.seqs, seqs), (self.values, values), (self.timestamps, timestamps)):
+            array[start:start + first] = block[:first]
+            array[:count - first] = block[first:]
+        self.head = head + count
+
+    def reader(self):
+        return sharedCursor(self)
+
+    def get(self, field):
+        return int(self.header[FIELDS.index(field)])
+
+    def set(self, field, value):
+        self.header[FIELDS.index(field)] = value
+
+    def close(self):
+        for name in ('timestamps', 'seqs', 'values', 'header'):
+            setattr(self, name, None)   # the views must go before the mapping closes
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class sharedCursor(ringCursor):
+    def __init__(self, ring, pollInterval=0.001):
+        ringCursor.__init__(self, ring)
+        self.pollInterval = pollInterval
+
+    def wait(self, timeout=None):
+        # poll head, there is no notification across processes
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.pending() <= 0:
+            if self.ring.get('stop'):
+                return False
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            time.sleep(self.pollInterval)
+        return True
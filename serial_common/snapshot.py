@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# Triple buffered frame exchange between the reader thread and the plot callbacks.
+# The reader (single writer) fills a slot nobody is looking at and then publishes it by storing its index,
+# readers decode the published slot under a sequence lock so every channel always comes from the same frame.
+
+import struct
+
+
+class frameBuffer:
+    def __init__(self, frameSize, dataType='h', slots=3):
+        self.decoder = struct.Struct('<' + dataType * (frameSize // struct.calcsize(dataType)))
+        self.slots = [bytearray(frameSize) for i in range(slots)]
+        self.versions = [0] * slots     # odd while the writer is filling the slot
+        self.numbers = [0] * slots      # publication number of the frame held by each slot
+        self.index = 0                  # slot holding the newest complete frame
+        self.published = 0
+        self.cache = (0, self.decoder.unpack_from(self.slots[0]))  # (number, values) decoded last
+
+    def publish(self, payload):
+        slot = (self.index + 1) % len(self.slots)   # never the slot readers are decoding
+        self.versions[slot] += 1
+        self.slots[slot][:] = payload
+        self.numbers[slot] = self.published + 1
+        self.versions[slot] += 1
+        self.index = slot   # single store: the frame becomes visible to the readers
+        self.published += 1
+
+    def read(self):
+        # return (number, values) of the newest frame, decoded only once however many callbacks ask for it
+        while True:
+            slot = self.index
+            version = self.versions[slot]
+            if version & 1:
+                continue
+            number = self.numbers[slot]
+            cache = self.cache
+            if cache[0] == number:
+                return cache
+            values = self.decoder.unpack_from(self.slots[slot])
+            if self.versions[slot] == version:  # the writer did not wrap around onto this slot meanwhile
+                self.cache = (number, values)
+                return self.cache
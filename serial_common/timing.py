@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# Sample timing: a perf_counter_ns time and a device counter for every frame, and running statistics of
+# the effective sample rate, the inter-arrival jitter and the gaps.
+#
+# A read returns all the frames that piled up in the OS buffer together, so only the last one arrived at the
+# read time; the earlier ones are dated back by the current sample period, never before the previous read.
+# The device counter is the 8 bit frame seq unwrapped into a running count.
+
+import collections
+
+import numpy as np
+
+
+class sampleClock:
+    def __init__(self, nominalRate=None, gapFactor=3.0, history=4096, smoothing=0.05):
+        self.nominalRate = nominalRate  # expected samples per second, None to estimate it
+        self.gapFactor = gapFactor      # an interval this many periods long is a gap
+        self.smoothing = smoothing      # EMA weight of the period estimate
+        self.period = None if nominalRate is None else 1e9 / nominalRate   # ns
+        self.counter = None             # device counter of the last frame, its low byte is the seq
+        self.lastTime = None
+        self.firstTime = None
+        self.samples = 0
+        self.lostFrames = 0             # missing according to the device counter
+        self.gaps = 0                   # intervals longer than gapFactor periods
+        self.longestGap = 0             # ns
+        self.count = 0                  # Welford over the inter-arrival intervals
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.intervals = collections.deque(maxlen=history)   # recent intervals for the percentiles
+
+    def update(self, arrival, seqs):
+        # frames of one read: returns (timestamps ns, device counters) as int64 arrays
+        seqs = np.asarray(seqs, np.int64)
+        count = len(seqs)
+        if count == 0:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        steps = np.diff(seqs, prepend=seqs[0] if self.counter is None else self.counter & 0xFF) & 0xFF
+        if self.counter is None:
+            counters = seqs[0] + np.cumsum(steps)
+        else:
+            counters = self.counter + np.cumsum(steps)
+            self.lostFrames += int(np.maximum(steps - 1, 0).sum())
+        self.counter = int(counters[-1])
+
+        times = np.full(count, arrival, np.int64)
+        if self.period is not None and count > 1:
+            times = arrival - ((counters[-1] - counters) * self.period).astype(np.int64)   # spaced by the device counter
+            if self.lastTime is not None:
+                times = np.maximum(times, self.lastTime)
+        if self.lastTime is None:
+            self.firstTime = int(times[0])
+            intervals = np.diff(times)
+        else:
+            intervals = np.diff(times, prepend=self.lastTime)
+            self.measure(arrival, int(counters[-1] - counters[0]) + 1)
+        self.lastTime = int(arrival)
+        self.samples += count
+        self.statistics(intervals)
+        return times, counters
+
+    def measure(self, arrival, frames):
+        # period estimate from the time between reads and the frames the device counted meanwhile
+        if self.nominalRate is not None or frames <= 0:
+            return
+        period = (arrival - self.lastTime) / frames
+        self.period = period if self.period is None else self.period + self.smoothing * (period - self.period)
+
+    def statistics(self, intervals):
+        if len(intervals) == 0 or self.period is None:  # the frames of the very first read carry no timing
+            return
+        self.intervals.extend(intervals.tolist())
+        for interval in intervals.tolist():
+            self.count += 1
+            delta = interval - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (interval - self.mean)
+        self.gaps += int((intervals > self.gapFactor * self.period).sum())
+        self.longestGap = max(self.longestGap, int(intervals.max()))
+
+    def rate(self):
+        # effective samples per second since the first frame
+        if self.samples < 2 or self.lastTime == self.firstTime:
+            return 0.0
+        return (self.samples - 1) * 1e9 / (self.lastTime - self.firstTime)
+
+    def jitter(self):
+        # standard deviation of the inter-arrival interval, ns
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+    def stats(self):
+        intervals = np.array(self.intervals) if self.intervals else np.zeros(1)
+        return {'samples': self.samples, 'rate_hz': self.rate(),
+                'period_ms': (self.period or 0.0) / 1e6, 'interval_mean_ms': self.mean / 1e6,
+                'jitter_ms': self.jitter() / 1e6, 'interval_p50_ms': float(np.percentile(intervals, 50)) / 1e6,
+                'interval_p99_ms': float(np.percentile(intervals, 99)) / 1e6,
+                'longest_gap_ms': self.longestGap / 1e6, 'gaps': self.gaps, 'lost_frames': self.lostFrames}